@@ -0,0 +1,96 @@
+def get_field(doc, field):
+    """
+    Gets a possibly nested field of a document.
+
+    Args:
+        doc (dict): the document
+        field (str): dotted field name, e.g. 'metadata.id'
+
+    Returns: the value, or None if any part of the path is missing.
+    """
+    for part in field.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+def id_set(collection, field="_id", query=None, batch_size=10000):
+    """
+    Collects the values of one field across a collection, fetching only that
+    field of each document.
+
+    Args:
+        collection (pymongo Collection): collection to scan
+        field (str): dotted field name. Default '_id'
+        query (dict): filter for the documents. Default None, all of them.
+        batch_size (int): documents per round trip. Default 10000
+
+    Returns: (set) the values.
+    """
+    projection = {field: 1} if field == "_id" else {field: 1, "_id": 0}
+    cursor = collection.find(query or {}, projection, batch_size=batch_size)
+    return {get_field(doc, field) for doc in cursor}
+
+
+def anti_join(
+    source,
+    exclude,
+    key="_id",
+    query=None,
+    projection=None,
+    batch_size=10000,
+):
+    """
+    Streams the documents of source whose key is not found in any of the
+    exclude collections, e.g. the tracks that still need lyrics. The keys to
+    exclude are collected with id-only scans and source is filtered as it
+    streams past, so no key list is ever sent back to the server. This works
+    on any MongoDB version. Running the anti-join in the server instead, as
+    a $lookup with both localField/foreignField and a pipeline, would need
+    MongoDB 5.0+.
+
+    Args:
+        source (pymongo Collection): collection of candidate work
+        exclude (list of tuples): (collection, field) pairs of work already
+            done, the field being the dotted name of the field compared to
+            key.
+        key (str): dotted field name in source. Default '_id'
+        query (dict): filter for source. Default None
+        projection (dict): fields of source to return, as in find. Default
+            None, all of them.
+        batch_size (int): documents per round trip. Default 10000
+
+    Returns: generator of the pending documents.
+    """
+    done = set()
+    for collection, field in exclude:
+        done |= id_set(collection, field, batch_size=batch_size)
+    if projection and key not in projection and key != "_id":
+        projection = dict(projection, **{key: 1})
+    for doc in source.find(query or {}, projection, batch_size=batch_size):
+        if get_field(doc, key) not in done:
+            yield doc
+
+
+def album_track_backlog(db, batch_size=10000):
+    """
+    Streams the ids of tracks on the scraped albums that are in neither
+    billboard.spotify nor billboard.spotify_nillboard.
+
+    Args:
+        db (pymongo Database): the billboard database
+        batch_size (int): documents per round trip. Default 10000
+
+    Returns: generator of track ids, each once.
+    """
+    exclude = [(db.spotify, "metadata.id"), (db.spotify_nillboard, "_id")]
+    seen = set()
+    for collection, field in exclude:
+        seen |= id_set(collection, field, batch_size=batch_size)
+    albums = db.spotify_albums.find({}, {"tracks.items.id": 1}, batch_size=batch_size)
+    for album in albums:
+        for track in album["tracks"]["items"]:
+            if track["id"] not in seen:
+                seen.add(track["id"])
+                yield track["id"]
@@ -0,0 +1,797 @@
+from src.pipe import (
+    BillboardData,
+    load_collection,
+    LOAD_COLLECTIONS,
+    SPOTIFY_SCHEMA,
+)
+
+from src.spotify_scraper import Spotify_Scraper
+from src.backlog import anti_join
+from src.my_nlp import Sentimenter, TOKEN_RE, load_lexicon
+
+import numpy as np
+import pandas as pd
+import spotipy
+from pymongo import MongoClient
+from pymongo.errors import DocumentTooLarge, OperationFailure
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import json, subprocess, sys, threading, time, zlib
+
+
+def timeit(f, repeat=3):
+    """
+    Times a function call, keeping the best of several runs.
+
+    Args:
+        f (function): function of no arguments to time
+        repeat (int): number of runs. Default 3
+
+    Returns: (float, object) best time in seconds and the last result of f.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def make_spotify_doc(i, rng, obj_id=True):
+    """
+    Makes a synthetic document shaped like the ones in billboard.spotify,
+    including the album and artist payloads the pipeline never uses.
+
+    Args:
+        i (int): index of the track, used to make unique ids
+        rng (numpy Generator): source of the random values
+        obj_id (bool): True to use a Hot 100 style _id. Default True
+
+    Returns: (dict) the document
+    """
+    markets = ["US", "CA", "GB", "DE", "FR", "MX", "BR", "JP"] * 10
+    album_id = f"album{i // 10}"
+    artist = {
+        "name": f"artist{i % 997}",
+        "id": f"artistid{i % 997}",
+        "uri": f"spotify:artist:artistid{i % 997}",
+        "external_urls": {"spotify": f"https://open.spotify.com/artist/{i % 997}"},
+        "type": "artist",
+    }
+    return {
+        "_id": f"hot100-{i}" if obj_id else f"track{i}",
+        "metadata": {
+            "artists": [artist, artist],
+            "album": {
+                "id": album_id,
+                "album_type": ["album", "single", "compilation"][i % 3],
+                "total_tracks": int(rng.integers(1, 20)),
+                "release_date": f"{2000 + i % 20}-{1 + i % 12:02d}-{1 + i % 28:02d}",
+                "release_date_precision": "day",
+                "artists": [artist],
+                "available_markets": markets,
+                "images": [
+                    {"height": h, "width": h, "url": f"https://i.scdn.co/{i}/{h}"}
+                    for h in (640, 300, 64)
+                ],
+                "name": f"album name {i // 10}",
+                "uri": f"spotify:album:{album_id}",
+            },
+            "available_markets": markets,
+            "disc_number": 1,
+            "duration_ms": int(rng.integers(120000, 300000)),
+            "explicit": bool(i % 2),
+            "external_ids": {"isrc": f"US{i:010d}"},
+            "id": f"track{i}",
+            "name": f"title {i}",
+            "popularity": int(rng.integers(0, 100)),
+            "preview_url": f"https://p.scdn.co/mp3-preview/{i}",
+            "track_number": 1 + i % 10,
+            "uri": f"spotify:track:track{i}",
+        },
+        "audio_features": {
+            "danceability": rng.random(),
+            "energy": rng.random(),
+            "acousticness": rng.random(),
+            "key": int(rng.integers(0, 12)),
+            "loudness": -20 * rng.random(),
+            "mode": int(rng.integers(0, 2)),
+            "speechiness": rng.random(),
+            "instrumentalness": rng.random(),
+            "liveness": rng.random(),
+            "valence": rng.random(),
+            "tempo": 60 + 120 * rng.random(),
+            "time_signature": 4,
+            "id": f"track{i}",
+            "uri": f"spotify:track:track{i}",
+            "track_href": f"https://api.spotify.com/v1/tracks/track{i}",
+            "analysis_url": f"https://api.spotify.com/v1/audio-analysis/track{i}",
+            "duration_ms": 200000,
+            "type": "audio_features",
+        },
+    }
+
+
+def legacy_load_spotify(collection):
+    """
+    The row-wise loader BillboardData used before load_collection, kept as
+    the reference for bench_load.
+
+    Args:
+        collection (pymongo Collection): collection to read from
+
+    Returns: Dataframe of the Spotify data.
+    """
+    return pd.DataFrame(
+        map(
+            lambda r: [r["metadata"]["artists"][0]["name"]]
+            + [r["metadata"]["album"][f] for f in ("id", "album_type", "total_tracks")]
+            + [
+                r["metadata"]["album"][f]
+                for f in ("release_date", "release_date_precision")
+            ]
+            + [
+                r["metadata"][f]
+                for f in (
+                    "disc_number",
+                    "duration_ms",
+                    "explicit",
+                    "id",
+                    "name",
+                    "popularity",
+                    "track_number",
+                )
+            ]
+            + [
+                r["audio_features"][f]
+                for f in (
+                    "danceability",
+                    "energy",
+                    "acousticness",
+                    "key",
+                    "loudness",
+                    "mode",
+                    "speechiness",
+                    "instrumentalness",
+                    "liveness",
+                    "valence",
+                    "tempo",
+                    "time_signature",
+                )
+            ]
+            + [r["_id"]],
+            collection.find(),
+        ),
+        columns=[name for name, _, _ in SPOTIFY_SCHEMA],
+    )
+
+
+def bench_load(db=None, n_tracks=50000, repeat=3, seed=0):
+    """
+    Compares the legacy row-wise Spotify loader to load_collection.
+    Fills db.spotify with synthetic tracks first, so db should be a
+    scratch database.
+
+    Args:
+        db (pymongo Database): scratch database. Default billboard_bench
+            on the local MongoDB.
+        n_tracks (int): number of synthetic tracks. Default 50000
+        repeat (int): runs per loader, best time is kept. Default 3
+        seed (int): seed for the synthetic data. Default 0
+
+    Returns: (dict) seconds per loader.
+    """
+    db = db if db is not None else MongoClient().billboard_bench
+    rng = np.random.default_rng(seed)
+    db.spotify.drop()
+    db.spotify.insert_many([make_spotify_doc(i, rng) for i in range(n_tracks)])
+
+    legacy_time, legacy_df = timeit(lambda: legacy_load_spotify(db.spotify), repeat)
+    columnar_time, columnar_df = timeit(
+        lambda: load_collection(db.spotify, SPOTIFY_SCHEMA), repeat
+    )
+    # load_collection decodes into the compact schema dtypes
+    columnar_df = columnar_df.astype(legacy_df.dtypes.to_dict())
+    pd.testing.assert_frame_equal(legacy_df, columnar_df)
+
+    print(f"spotify tracks: {n_tracks}")
+    print(f"legacy loader:   {legacy_time:.3f}s")
+    print(f"columnar loader: {columnar_time:.3f}s")
+    print(f"speedup:         {legacy_time / columnar_time:.1f}x")
+    return {"legacy": legacy_time, "columnar": columnar_time}
+
+
+def populate_bench_db(db, n_tracks, seed=0, chunk_size=10000):
+    """
+    Fills the five collections BillboardData.load reads with synthetic data:
+    one track in seven on the Hot 100, ten tracks per album and scored
+    lyrics for four tracks in five. Existing collections are dropped, so db
+    should be a scratch database.
+
+    Args:
+        db (pymongo Database): scratch database
+        n_tracks (int): number of Spotify tracks, Billboard and Nillboard
+        seed (int): seed for the synthetic data. Default 0
+        chunk_size (int): documents per insert_many. Default 10000
+
+    Returns: None
+    """
+    rng = np.random.default_rng(seed)
+    for name, _ in LOAD_COLLECTIONS:
+        db[name].drop()
+
+    for start in range(0, n_tracks, chunk_size):
+        billboard, nillboard, hot100, lyrics = [], [], [], []
+        for i in range(start, min(start + chunk_size, n_tracks)):
+            on_billboard = i % 7 == 0
+            track = make_spotify_doc(i, rng, obj_id=on_billboard)
+            if on_billboard:
+                billboard.append(track)
+                hot100.append(
+                    {
+                        "_id": track["_id"],
+                        "artist": track["metadata"]["artists"][0]["name"],
+                        "title": track["metadata"]["name"],
+                        "date": track["metadata"]["album"]["release_date"],
+                        "peakPos": int(rng.integers(1, 101)),
+                        "weeks": int(rng.integers(1, 53)),
+                    }
+                )
+            else:
+                nillboard.append(track)
+            if i % 5:
+                pos, neg = rng.integers(0, 40, 2)
+                lyrics.append(
+                    {
+                        "_id": track["metadata"]["id"],
+                        "response_artist": track["metadata"]["artists"][0]["name"],
+                        "response_title": track["metadata"]["name"],
+                        "lyrics": "la " * 300,
+                        "dict_sentiment": {
+                            "sentiment": float((pos - neg) / (pos + neg + 1)),
+                            "pos": int(pos),
+                            "neg": int(neg),
+                            "wordcount": 300,
+                        },
+                    }
+                )
+        for name, docs in (
+            ("spotify", billboard),
+            ("spotify_nillboard", nillboard),
+            ("hot100filtered", hot100),
+            ("lyrics", lyrics),
+        ):
+            if docs:
+                db[name].insert_many(docs)
+
+    n_albums = (n_tracks + 9) // 10
+    for start in range(0, n_albums, chunk_size):
+        db.spotify_albums.insert_many(
+            [
+                {
+                    "_id": f"album{a}",
+                    "label": ["Columbia", "Def Jam/Island Records", "Indie"][a % 3],
+                    "popularity": int(rng.integers(0, 100)),
+                    "tracks": {"items": []},
+                }
+                for a in range(start, min(start + chunk_size, n_albums))
+            ]
+        )
+
+
+def legacy_derived_columns(df):
+    """
+    The row-wise release_year, release_month and track_placement computation
+    transform_for_models used before release_parts, kept as the reference
+    for bench_transform. The legacy code parsed dates with a day-only
+    format; here every precision is parsed, keeping the legacy month rule.
+
+    Args:
+        df (Pandas DataFrame): frame from BillboardData.load
+
+    Returns: Dataframe of the three derived columns.
+    """
+    release_date = pd.to_datetime(df.release_date, format="mixed")
+    df = df.assign(release_date=release_date)
+    return pd.DataFrame(
+        {
+            "release_year": df.release_date.apply(lambda dt: dt.year),
+            "release_month": df.apply(
+                lambda r: (
+                    r.release_date.month
+                    if r.release_date_precision == "day"
+                    else np.nan
+                ),
+                axis=1,
+            ),
+            "track_placement": df.apply(
+                lambda r: (
+                    (r.track_number / r.total_tracks + 1 - 1 / r.disc_number)
+                    if r.total_tracks > 1
+                    else -1
+                ),
+                axis=1,
+            ),
+        }
+    )
+
+
+# columns transform_for_models drops, filled with placeholders in its frames
+TRANSFORM_DROPPED = (
+    "track_id",
+    "artist",
+    "album_id",
+    "title",
+    "response_artist",
+    "response_title",
+    "bb_artist",
+    "bb_title",
+    "peakPos",
+    "weeks",
+    "date_entered_bb",
+    "album_type",
+)
+
+
+def make_transform_frame(n_tracks, rng):
+    """
+    Makes a synthetic frame with the columns transform_for_models uses and
+    drops, with day, month and year precision release dates.
+
+    Args:
+        n_tracks (int): number of rows
+        rng (numpy Generator): source of the random values
+
+    Returns: (Pandas DataFrame) the frame.
+    """
+    years = rng.integers(1990, 2020, n_tracks)
+    months = rng.integers(1, 13, n_tracks)
+    days = rng.integers(1, 29, n_tracks)
+    precision = rng.choice(["day", "month", "year"], n_tracks, p=[0.8, 0.1, 0.1])
+    dates = [
+        {"day": f"{y}-{m:02d}-{d:02d}", "month": f"{y}-{m:02d}", "year": f"{y}"}[p]
+        for y, m, d, p in zip(years, months, days, precision)
+    ]
+    df = pd.DataFrame(
+        {
+            "release_date": dates,
+            "release_date_precision": pd.Categorical(precision),
+            "total_tracks": rng.integers(1, 20, n_tracks).astype(np.int16),
+            "track_number": rng.integers(1, 20, n_tracks).astype(np.int16),
+            "disc_number": rng.integers(1, 3, n_tracks).astype(np.int16),
+            "obj_id": np.where(rng.random(n_tracks) < 0.2, "hit", None),
+            "poscount": rng.integers(0, 50, n_tracks).astype(np.float32),
+            "negcount": rng.integers(0, 50, n_tracks).astype(np.float32),
+        }
+    )
+    for column in TRANSFORM_DROPPED:
+        df[column] = None
+    return df
+
+
+def bench_transform(n_tracks=200000, repeat=3, seed=0):
+    """
+    Checks that BillboardData.transform_for_models gives the legacy
+    row-wise derived columns on day, month and year precision dates, then
+    times both.
+
+    Args:
+        n_tracks (int): number of synthetic tracks. Default 200000
+        repeat (int): runs per version, best time is kept. Default 3
+        seed (int): seed for the synthetic data. Default 0
+
+    Returns: (dict) seconds per version.
+    """
+    df = make_transform_frame(n_tracks, np.random.default_rng(seed))
+    bbd = BillboardData(db=object())
+
+    def transform():
+        bbd.df = df.copy()
+        bbd.transform_for_models()
+        return bbd.df[["release_year", "release_month", "track_placement"]]
+
+    legacy_time, legacy = timeit(lambda: legacy_derived_columns(df), repeat)
+    vector_time, vector = timeit(transform, repeat)
+    pd.testing.assert_frame_equal(legacy.astype(vector.dtypes.to_dict()), vector)
+
+    print(f"tracks: {n_tracks}")
+    print(f"legacy transform:     {legacy_time:.3f}s")
+    print(f"vectorized transform: {vector_time:.3f}s")
+    print(f"speedup:              {legacy_time / vector_time:.1f}x")
+    return {"legacy": legacy_time, "vectorized": vector_time}
+
+
+class MockSpotifyHandler(BaseHTTPRequestHandler):
+    """
+    Answers the Spotify Web API search and audio-features endpoints with
+    synthetic tracks after a fixed delay, standing in for the real API in
+    scraper benchmarks. Every search finds a track.
+    """
+
+    latency = 0.05
+
+    def do_GET(self):
+        """
+        Handles one request.
+
+        Args: None
+
+        Returns: None, but writes the JSON response.
+        """
+        time.sleep(self.latency)
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if url.path.endswith("/search"):
+            i = zlib.crc32(params["q"][0].encode())
+            track = make_spotify_doc(i, np.random.default_rng(i))["metadata"]
+            body = {"tracks": {"total": 1, "items": [track]}}
+        elif "audio-features" in url.path:
+            body = {"audio_features": []}
+            for track_id in params["ids"][0].split(","):
+                features = make_spotify_doc(0, np.random.default_rng(0))
+                features = features["audio_features"]
+                features.update(id=track_id, uri=f"spotify:track:{track_id}")
+                body["audio_features"].append(features)
+        else:
+            self.send_error(404)
+            return
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        """
+        Silences the per-request log lines.
+        """
+        pass
+
+
+def mock_spotify(latency=0.05):
+    """
+    Starts a MockSpotifyHandler server on a background thread and makes a
+    spotipy client that talks to it.
+
+    Args:
+        latency (float): seconds the server waits before each response.
+            Default 0.05
+
+    Returns: (ThreadingHTTPServer, spotipy.Spotify) the server, to shut
+    down when done, and the client.
+    """
+    handler = type("Handler", (MockSpotifyHandler,), {"latency": latency})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    sp = spotipy.Spotify(auth="mock", retries=0)
+    sp.prefix = f"http://127.0.0.1:{server.server_address[1]}/v1/"
+    return server, sp
+
+
+def bench_spotify_scrape(db=None, n_tracks=500, concurrency=8, latency=0.05):
+    """
+    Compares Spotify_Scraper.scrape_all to scrape_all_async against a local
+    mock Spotify server. Both write to db.spotify, which is dropped first,
+    so db should be a scratch database.
+
+    Args:
+        db (pymongo Database): scratch database. Default billboard_bench
+            on the local MongoDB.
+        n_tracks (int): tracks to search for. Default 500
+        concurrency (int): searches in flight for scrape_all_async. Default 8
+        latency (float): mock server response time in seconds. Default 0.05
+
+    Returns: (dict) seconds per scraping mode.
+    """
+    db = db if db is not None else MongoClient().billboard_bench
+    server, sp = mock_spotify(latency)
+    scraper = Spotify_Scraper(sleeptime=0, sp=sp, db=db, use_index=False)
+    rows = [
+        {"_id": f"hot100-{i}", "artist": f"artist {i}", "title": f"title {i}"}
+        for i in range(n_tracks)
+    ]
+
+    def scrape(mode):
+        db.spotify.drop()
+        scraper.to_scrape = rows
+        if mode == "sync":
+            scraper.scrape_all(None, {}, verbose=0)
+        else:
+            scraper.scrape_all_async(None, {}, concurrency=concurrency, verbose=0)
+        return db.spotify.count_documents({})
+
+    results = {}
+    for mode in ("sync", "async"):
+        results[mode], scraped = timeit(lambda: scrape(mode), 1)
+        assert scraped == n_tracks
+    server.shutdown()
+
+    print(f"tracks: {n_tracks}, mock latency: {latency}s")
+    print(f"scrape_all:       {results['sync']:.2f}s")
+    print(f"scrape_all_async: {results['async']:.2f}s")
+    return results
+
+
+def legacy_lyrics_backlog(db):
+    """
+    The nillboard lyrics backlog as Scraper.populate_nillboard_scrapables
+    computed it before anti_join: whole documents pulled to collect ids,
+    sent back in a $nin list. Kept as the reference for bench_backlog.
+
+    Args:
+        db (pymongo Database): database with the scraped collections
+
+    Returns: (list) ids of the nillboard tracks without lyrics.
+    """
+    scraped_ids = [r["_id"] for r in db.lyrics.find()] + [
+        r["metadata"]["id"] for r in db.spotify.find()
+    ]
+    tracks_cursor = db.spotify_nillboard.find({"_id": {"$nin": scraped_ids}})
+    return [r["_id"] for r in tracks_cursor]
+
+
+def bench_backlog(db=None, sizes=(10000, 100000, 1000000), seed=0):
+    """
+    Compares the legacy $nin lyrics backlog to anti_join with id-only scans.
+    The scratch database is refilled for every size. A legacy query too
+    large to send is reported as failed.
+
+    Args:
+        db (pymongo Database): scratch database. Default billboard_bench
+            on the local MongoDB.
+        sizes (tuple of int): numbers of tracks to compare at.
+            Default (10000, 100000, 1000000)
+        seed (int): seed for the synthetic data. Default 0
+
+    Returns: (dict) seconds per method for each size, None where the
+        method failed.
+    """
+    db = db if db is not None else MongoClient().billboard_bench
+    exclude = [(db.lyrics, "_id"), (db.spotify, "metadata.id")]
+    projection = {"metadata.artists.name": 1, "metadata.name": 1}
+    methods = {
+        "legacy": lambda: legacy_lyrics_backlog(db),
+        "id scans": lambda: [
+            r["_id"]
+            for r in anti_join(db.spotify_nillboard, exclude, projection=projection)
+        ],
+    }
+
+    results = {}
+    for n_tracks in sizes:
+        populate_bench_db(db, n_tracks, seed)
+        print(f"tracks: {n_tracks}")
+        results[n_tracks] = {}
+        expected = None
+        for name, method in methods.items():
+            try:
+                seconds, pending = timeit(method, 1)
+            except (DocumentTooLarge, OperationFailure) as e:
+                print(f"{name:>9}: failed, {type(e).__name__}")
+                results[n_tracks][name] = None
+                continue
+            expected = expected if expected is not None else set(pending)
+            assert set(pending) == expected
+            print(f"{name:>9}: {seconds:.3f}s, {len(pending)} pending")
+            results[n_tracks][name] = seconds
+    return results
+
+
+def make_lyrics(rng, words, n_lines=40):
+    """
+    Makes synthetic song lyrics: short lines of common and lexicon words
+    with the contractions, quotes, brackets and punctuation real lyrics have.
+
+    Args:
+        rng (numpy Generator): source of the random choices
+        words (list of str): lexicon words to mix in
+        n_lines (int): number of lines. Default 40
+
+    Returns: (str) the lyrics.
+    """
+    common = (
+        "i you me we baby oh yeah the a and my your love night heart "
+        "don't can't I'm you're we'll it's gonna wanna 'cause lovin' "
+        "nothin' ain't they've cannot 'tis"
+    ).split()
+    ends = ["", "", "", ",", ".", "!", "?", "...", " --", ":"]
+    lines = []
+    for _ in range(n_lines):
+        line = list(rng.choice(common, int(rng.integers(3, 9))))
+        for _ in range(int(rng.integers(0, 3))):
+            line.insert(int(rng.integers(0, len(line) + 1)), rng.choice(words))
+        if rng.random() < 0.1:
+            line[0] = f'"{line[0]}'
+            line[-1] = f'{line[-1]}"'
+        if rng.random() < 0.05:
+            line = ["[Chorus]"] if rng.random() < 0.5 else ["(" + " ".join(line) + ")"]
+        lines.append(" ".join(line).capitalize() + rng.choice(ends))
+    return "\n".join(lines)
+
+
+def sentiment_equivalence(texts, sentimenter=None, examples=3):
+    """
+    Compares Sentimenter's fast path to the Treebank path on a corpus and
+    prints how often each score field agrees, with a few texts whose tokens
+    differ.
+
+    Args:
+        texts (list of str): corpus to compare on
+        sentimenter (Sentimenter): scorer to use. Default None, a new one.
+        examples (int): differing texts to show. Default 3
+
+    Returns: (dict) the share of texts on which each field, and all of
+        them, agree, and the largest sentiment difference.
+    """
+    s = sentimenter or Sentimenter()
+    fields = ("sentiment", "pos", "neg", "wordcount")
+    agree = dict.fromkeys(fields + ("all",), 0)
+    max_diff = 0.0
+    shown = 0
+    for text in texts:
+        slow, fast = s.sentiment(text), s.sentiment_fast(text)
+        for field in fields:
+            agree[field] += slow[field] == fast[field]
+        agree["all"] += slow == fast
+        max_diff = max(max_diff, abs(slow["sentiment"] - fast["sentiment"]))
+        if slow != fast and shown < examples:
+            # Treebank turns quotes into `` and '', which score the same as "
+            quotes = {"``": '"', "''": '"'}
+            tokens = [quotes.get(w.lower(), w.lower()) for w in s.tok.tokenize(text)]
+            fast_tokens = [quotes.get(w, w) for w in TOKEN_RE.findall(text.lower())]
+            first = next(
+                (i for i, (a, b) in enumerate(zip(tokens, fast_tokens)) if a != b),
+                min(len(tokens), len(fast_tokens)),
+            )
+            print(f"  differs near: {tokens[max(0, first - 3) : first + 3]}")
+            shown += 1
+
+    report = {field: n / len(texts) for field, n in agree.items()}
+    report["max_sentiment_diff"] = max_diff
+    print(f"texts: {len(texts)}")
+    for field in fields + ("all",):
+        print(f"{field:>9} identical: {report[field]:.2%}")
+    print(f"max sentiment difference: {max_diff:.4f}")
+    return report
+
+
+def bench_sentiment(db=None, n_docs=2000, repeat=3, seed=0):
+    """
+    Times Sentimenter's Treebank and fast paths and reports their
+    equivalence, on lyrics sampled from db or on synthetic lyrics.
+
+    Args:
+        db (pymongo Database): database to sample billboard.lyrics style
+            documents from. Default None, synthetic lyrics.
+        n_docs (int): number of texts. Default 2000
+        repeat (int): runs per path, best time is kept. Default 3
+        seed (int): seed for the synthetic lyrics. Default 0
+
+    Returns: (dict) seconds per path and the equivalence report.
+    """
+    s = Sentimenter()
+    if db is not None:
+        docs = db.lyrics.aggregate([{"$sample": {"size": n_docs}}])
+        texts = [doc["lyrics"] for doc in docs if doc.get("lyrics")]
+    else:
+        rng = np.random.default_rng(seed)
+        words = sorted(s.pos)[:200] + sorted(s.neg)[:200]
+        texts = [make_lyrics(rng, words) for _ in range(n_docs)]
+
+    report = sentiment_equivalence(texts, s)
+    treebank_time, _ = timeit(lambda: [s.sentiment(t) for t in texts], repeat)
+    fast_time, _ = timeit(lambda: [s.sentiment_fast(t) for t in texts], repeat)
+    print(f"treebank: {len(texts) / treebank_time:.0f} docs/s")
+    print(f"fast:     {len(texts) / fast_time:.0f} docs/s")
+    print(f"speedup:  {treebank_time / fast_time:.1f}x")
+    return {"treebank": treebank_time, "fast": fast_time, "equivalence": report}
+
+
+def bench_sentiment_batch(n_docs=10000, chunk_size=5000, repeat=3, seed=0):
+    """
+    Times Sentimenter.sentiment_batch on synthetic lyrics, split into
+    building the document-term matrix and the sparse scoring multiply,
+    checks it against sentiment_fast and projects the time for 1M lyrics.
+
+    Args:
+        n_docs (int): number of texts. Default 10000
+        chunk_size (int): texts per sentiment_batch call, as in
+            score_lyrics. Default 5000
+        repeat (int): runs per step, best time is kept. Default 3
+        seed (int): seed for the synthetic lyrics. Default 0
+
+    Returns: (dict) seconds per step for all texts, and whether the batch
+        scores equal the fast path's.
+    """
+    s = Sentimenter()
+    rng = np.random.default_rng(seed)
+    words = sorted(s.pos)[:200] + sorted(s.neg)[:200]
+    texts = [make_lyrics(rng, words) for _ in range(n_docs)]
+    chunks = [texts[i : i + chunk_size] for i in range(0, n_docs, chunk_size)]
+
+    equal = s.sentiment_batch(texts[:1000]) == [
+        s.sentiment_fast(text) for text in texts[:1000]
+    ]
+    matrix_time, matrices = timeit(
+        lambda: [s.document_term_matrix(chunk) for chunk in chunks], repeat
+    )
+    multiply_time, _ = timeit(
+        lambda: [(matrix @ s.weights).toarray() for matrix in matrices], repeat
+    )
+    batch_time, _ = timeit(
+        lambda: [s.sentiment_batch(chunk) for chunk in chunks], repeat
+    )
+    fast_time, _ = timeit(lambda: [s.sentiment_fast(text) for text in texts], 1)
+
+    per_million = 1e6 / n_docs
+    print(f"batch equals fast path: {equal}")
+    print(f"document-term matrices: {matrix_time * per_million:.1f} s per 1M docs")
+    print(f"sparse multiply:        {multiply_time * per_million:.2f} s per 1M docs")
+    print(f"sentiment_batch:        {n_docs / batch_time:.0f} docs/s")
+    print(f"sentiment_fast:         {n_docs / fast_time:.0f} docs/s")
+    return {
+        "matrix": matrix_time,
+        "multiply": multiply_time,
+        "batch": batch_time,
+        "fast": fast_time,
+        "equal": equal,
+    }
+
+
+# run in a fresh interpreter by bench_startup; prints its timings as JSON
+STARTUP_SCRIPT = """
+import json, time
+start = time.perf_counter()
+from src.my_nlp import Sentimenter
+imported = time.perf_counter()
+s = Sentimenter(fast={fast})
+s.sentiment("I love this song but I hate the ending.")
+scored = time.perf_counter()
+print(json.dumps({{"import": imported - start, "first_score": scored - imported}}))
+"""
+
+
+def bench_startup(repeat=5):
+    """
+    Times importing src.my_nlp and scoring a first text in fresh
+    interpreters, as a scoring worker process does on start-up, for the
+    Treebank and fast paths. The lexicon pickle is built beforehand.
+
+    Args:
+        repeat (int): interpreters started per path, best time is kept.
+            Default 5
+
+    Returns: (dict) path to its best import and first-score seconds.
+    """
+    load_lexicon()
+    results = {}
+    for name, fast in (("treebank", False), ("fast", True)):
+        runs = [
+            json.loads(
+                subprocess.run(
+                    [sys.executable, "-c", STARTUP_SCRIPT.format(fast=fast)],
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                ).stdout
+            )
+            for _ in range(repeat)
+        ]
+        best = {key: min(run[key] for run in runs) for key in runs[0]}
+        print(
+            f"{name}: import {best['import'] * 1000:.0f} ms, "
+            f"first score {best['first_score'] * 1000:.0f} ms"
+        )
+        results[name] = best
+    return results
+
+
+if __name__ == "__main__":
+    bench_load()
+    bench_transform()
+    bench_spotify_scrape()
+    bench_backlog()
+    bench_sentiment()
+    bench_sentiment_batch()
+    bench_startup()
@@ -1,11 +1,49 @@
-import json, billboard, time
+import json, billboard, threading, time, requests
 from pymongo import MongoClient
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.exceptions import HTTPError
+from src.rate_limiter import RateLimiter
+from src.bulk_writer import BulkWriter
+from src.http_cache import CachingAdapter
+from datetime import datetime, timedelta
 import pandas as pd
 import numpy as np
 
+# extended timeout for billboard.py chart requests
+CHART_KWARGS = {"name": "hot-100", "max_retries": 5, "timeout": 120}
 
-def run(date=None, verbose=1):
+# billboard.py's own session factory, restored by use_cache(None)
+_get_session = billboard._get_session_with_retries
+
+# limiter of the fetch_chart call running on this thread, for cached sessions
+_fetching = threading.local()
+
+
+def use_cache(cache):
+    """
+    Routes billboard.py's chart downloads through a ResponseCache, or back to
+    the network if cache is None. Applies to all later calls of run, crawl
+    and fetch_chart, which then take a token from their limiter only for
+    charts the cache misses.
+
+    Args:
+        cache: ResponseCache, or None to stop caching.
+
+    Returns: None
+    """
+
+    def get_session(max_retries):
+        session = requests.Session()
+        limiter = getattr(_fetching, "limiter", None)
+        session.mount(
+            "https://", CachingAdapter(cache, limiter, max_retries=max_retries)
+        )
+        return session
+
+    billboard._get_session_with_retries = get_session if cache else _get_session
+
+
+def run(date=None, verbose=1, limiter=None):
     """
     Collects all Billboard Hot 100 data starting from the given date and
     iterating through previous dates.
@@ -13,6 +51,8 @@ def run(date=None, verbose=1):
     Args: 
         date: string in 'YYYY-MM-DD' format to start at.
         verbose: 0 or 1, with 1 meaning more status messages will be printed.
+        limiter: RateLimiter for the chart requests, which may be shared with
+            other scrapers. Default None, a new one at one chart per 2 seconds.
 
     Returns: nothing. Puts the gathered data in a mongo DB named billboard and 
         with collection name hot100.
@@ -22,30 +62,175 @@ def run(date=None, verbose=1):
     # initialize DB connection
     collection = MongoClient()["billboard"]["hot100"]
 
-    # initialize arguments and extend timeout
-    kwargs = {"name": "hot-100", "max_retries": 5, "timeout": 120}
+    limiter = limiter or RateLimiter(rate=0.5)
+
     if not date:
-        date = billboard.ChartData(**kwargs).date
+        date = billboard.ChartData(**CHART_KWARGS).date
 
     while date:
-        kwargs["date"] = date
-
-        # get billboard data through billboard.py
-        chart = billboard.ChartData(**kwargs)
-
-        # prep chart data for mongo
-        weekdata = json.loads(chart.json())
-        weekdata["_id"] = weekdata["date"]
-        weekdata["scraped"] = datetime.utcnow()
+        chart, weekdata = fetch_chart(date, limiter)
 
         # insert into mongo
         collection.insert_one(weekdata)
 
         if verbose:
-            print(date)
+            print(date, limiter.report())
 
         date = chart.previousDate
-        time.sleep(2)
+
+
+def fetch_chart(date, limiter):
+    """
+    Gets one Hot 100 chart through billboard.py under a rate limiter, backing
+    off and retrying when rate limited.
+
+    Args:
+        date: string in 'YYYY-MM-DD' format of the chart week.
+        limiter: RateLimiter for the chart requests.
+
+    Returns: (billboard.ChartData, dict) the chart and its document for the
+        hot100 collection.
+    """
+    # with a cache, its session takes the token only if the chart is sent for
+    _fetching.limiter = limiter
+    while True:
+        if billboard._get_session_with_retries is _get_session:
+            limiter.acquire()
+        try:
+            chart = billboard.ChartData(date=date, **CHART_KWARGS)
+        except HTTPError as e:
+            if getattr(e.response, "status_code", None) != 429:
+                raise
+            limiter.throttled(e.response.headers.get("Retry-After"))
+            continue
+        limiter.success()
+        break
+
+    # prep chart data for mongo
+    weekdata = json.loads(chart.json())
+    weekdata["_id"] = weekdata["date"]
+    weekdata["scraped"] = datetime.utcnow()
+    return chart, weekdata
+
+
+def chart_dates(start, end=None):
+    """
+    Lists the Hot 100 chart dates in a range. Charts are dated weekly on
+    Saturdays, so this counts back in weeks from the last Saturday on or
+    before end. Billboard publishes each chart on a Tuesday, dated the
+    Saturday after, so without an end the newest date is that of the latest
+    published chart: the most recent Tuesday plus 4 days.
+
+    Args:
+        start: string in 'YYYY-MM-DD' format, the earliest date to include.
+        end: string in 'YYYY-MM-DD' format, the latest date to include.
+            Default None, up to the latest published chart.
+
+    Returns: list of 'YYYY-MM-DD' strings, newest first.
+    """
+    start = datetime.strptime(start, "%Y-%m-%d").date()
+    if end:
+        end = datetime.strptime(end, "%Y-%m-%d").date()
+        week = end - timedelta(days=(end.weekday() - 5) % 7)
+    else:
+        today = datetime.now().date()
+        tuesday = today - timedelta(days=(today.weekday() - 1) % 7)
+        week = tuesday + timedelta(days=4)
+    dates = []
+    while week >= start:
+        dates.append(week.isoformat())
+        week -= timedelta(weeks=1)
+    return dates
+
+
+def crawl(start, end=None, workers=4, limiter=None, verbose=1, queue=None):
+    """
+    Collects the Billboard Hot 100 charts in a date range in parallel. Dates
+    already in billboard.hot100 are skipped, so an interrupted crawl picks up
+    where it left off when rerun.
+
+    Args:
+        start: string in 'YYYY-MM-DD' format, the earliest chart to collect.
+        end: string in 'YYYY-MM-DD' format, the latest chart to collect.
+            Default None, the current chart.
+        workers: charts fetched at once. Default 4
+        limiter: RateLimiter shared by the workers, and possibly other
+            scrapers. Default None, a new one at one chart per 2 seconds.
+        verbose: 0 or 1, with 1 meaning more status messages will be printed.
+        queue: JobQueue to share the dates through as 'hot100' jobs, so
+            crawls on several machines split them. Default None
+
+    Returns: (list of str) dates that failed and should be retried.
+    """
+    collection = MongoClient()["billboard"]["hot100"]
+    limiter = limiter or RateLimiter(rate=0.5)
+
+    dates = chart_dates(start, end)
+    scraped = {week["_id"] for week in collection.find({}, {"_id": 1})}
+    to_scrape = [d for d in dates if d not in scraped]
+    if verbose:
+        print(f"Charts in range: {len(dates)}, remaining: {len(to_scrape)}")
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as pool, BulkWriter(
+        collection, batch_size=50, flush_interval=60
+    ) as writer:
+        if queue is None:
+            failed = _crawl_dates(to_scrape, pool, writer, limiter, verbose)
+        else:
+            queue.enqueue("hot100", ((d, {"date": d}) for d in to_scrape))
+            while True:
+                with queue.lease("hot100", workers * 4) as jobs:
+                    if not jobs:
+                        break
+                    dates = [job["key"] for job in jobs]
+                    batch_failed = _crawl_dates(dates, pool, writer, limiter, verbose)
+
+                    # charts are written before their jobs are marked done
+                    writer.flush()
+                    if batch_failed:
+                        token = jobs[0]["token"]
+                        queue.fail(token, "chart fetch failed", keys=batch_failed)
+            failed = [
+                job["key"]
+                for job in queue.jobs.find(
+                    {"kind": "hot100", "state": "failed", "key": {"$in": to_scrape}},
+                    {"key": 1},
+                )
+            ]
+
+    if verbose:
+        print(writer.report())
+    return failed
+
+
+def _crawl_dates(dates, pool, writer, limiter, verbose):
+    """
+    Helper function for crawl that fetches charts on a thread pool and
+    queues them for writing.
+
+    Args:
+        dates: list of 'YYYY-MM-DD' strings to fetch.
+        pool: ThreadPoolExecutor to fetch on.
+        writer: BulkWriter for billboard.hot100.
+        limiter: RateLimiter shared by the fetches.
+        verbose: 0 or 1, with 1 meaning more status messages will be printed.
+
+    Returns: (list of str) dates that failed.
+    """
+    failed = []
+    futures = {pool.submit(fetch_chart, d, limiter): d for d in dates}
+    for i, future in enumerate(as_completed(futures)):
+        try:
+            chart, weekdata = future.result()
+        except Exception as e:
+            failed.append(futures[future])
+            print(f"{futures[future]} failed: {e!r}")
+            continue
+        writer.add(weekdata)
+        if verbose:
+            print(f"{i + 1}/{len(dates)} {chart.date}", limiter.report())
+    return failed
 
 
 def clean():
@@ -87,10 +272,11 @@ def clean():
         .reset_index()
     )
 
-    # inserts rows to db
-    for i in range(df.shape[0]):
-        entry = df.iloc[i].to_dict()
-        entry["peakPos"] = int(entry["peakPos"])
-        entry["weeks"] = int(entry["weeks"])
-
-        hot100filtered.insert_one(entry)
+    # inserts rows to db in bulk
+    with BulkWriter(hot100filtered, batch_size=10000, stamp="scraped") as writer:
+        for i in range(df.shape[0]):
+            entry = df.iloc[i].to_dict()
+            entry["peakPos"] = int(entry["peakPos"])
+            entry["weeks"] = int(entry["weeks"])
+            writer.add(entry)
+    print(writer.report())
@@ -0,0 +1,204 @@
+import atexit, threading, time
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+# MongoDB error code for a duplicate key
+DUPLICATE_KEY = 11000
+
+# writers holding unwritten documents, flushed by one hook at interpreter exit.
+# Writers with an empty buffer are not referenced, so they can be collected.
+_unflushed = set()
+
+
+@atexit.register
+def _flush_unflushed():
+    """
+    Flushes the writers that still hold documents at exit, reporting rather
+    than raising the errors of clients that have already gone away.
+
+    Args: None
+
+    Returns: None
+    """
+    for writer in list(_unflushed):
+        try:
+            writer.flush()
+        except PyMongoError as e:
+            print(f"{writer.collection.name}: unwritten at exit, {e!r}")
+
+
+class BulkWriter:
+    """
+    Buffers documents bound for one collection and writes them with unordered
+    bulk_write calls, so scrapers make one round trip per batch instead of
+    one per document. Documents with an _id are upserted with $setOnInsert,
+    leaving an existing document untouched and counting it as a duplicate;
+    documents without one are inserted. The buffer is flushed once it holds
+    batch_size documents, on the first add after flush_interval seconds and
+    on close; use the writer as a context manager or close it, as documents
+    left in the buffer are only written at interpreter exit. With a stamp
+    field, every document is upserted and the field is set to the server's
+    time when the document is first written, with $currentDate, so it
+    records when the document reached the database rather than when it was
+    buffered; a duplicate keeps its stamp. Safe to share across threads.
+
+    Args:
+        collection (pymongo Collection): collection to write to
+        batch_size (int): documents buffered before a flush. Default 1000
+        flush_interval (float): max seconds a document waits in the buffer
+            before the next add flushes it. Default 5.0
+        verbose (int): 1 prints a line per flush. Default 0
+        stamp (str): field set to the server's time when a document is
+            first written. Default None, no stamp
+    """
+
+    def __init__(
+        self, collection, batch_size=1000, flush_interval=5.0, verbose=0, stamp=None
+    ):
+        self.collection = collection
+        self.stamp = stamp
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.verbose = verbose
+
+        self._lock = threading.Lock()
+        self._ops = []
+        self._oldest = None
+        self.inserted = 0
+        self.duplicates = 0
+        self.flushes = 0
+        self.failed = []
+
+    def add(self, doc):
+        """
+        Buffers a document, flushing if a threshold is reached.
+
+        Args:
+            doc (dict): document to write
+
+        Returns: None
+        """
+        if self.stamp:
+            # a stamped document matches nothing, so the upsert fails as a
+            # duplicate key and leaves it, and its stamp, untouched
+            _id = doc.get("_id", ObjectId())
+            fields = {k: v for k, v in doc.items() if k not in ("_id", self.stamp)}
+            update = {"$currentDate": {self.stamp: True}}
+            if fields:
+                update["$setOnInsert"] = fields
+            op = UpdateOne(
+                {"_id": _id, self.stamp: {"$exists": False}}, update, upsert=True
+            )
+        elif "_id" in doc:
+            fields = {k: v for k, v in doc.items() if k != "_id"} or doc
+            op = UpdateOne({"_id": doc["_id"]}, {"$setOnInsert": fields}, upsert=True)
+        else:
+            op = InsertOne(doc)
+        with self._lock:
+            if not self._ops:
+                self._oldest = time.monotonic()
+                _unflushed.add(self)
+            self._ops.append(op)
+            due = (
+                len(self._ops) >= self.batch_size
+                or time.monotonic() - self._oldest >= self.flush_interval
+            )
+        if due:
+            self.flush()
+
+    def extend(self, docs):
+        """
+        Buffers several documents.
+
+        Args:
+            docs (iterable of dicts): documents to write
+
+        Returns: None
+        """
+        for doc in docs:
+            self.add(doc)
+
+    def flush(self):
+        """
+        Writes all buffered documents in one unordered bulk_write. Duplicate
+        key errors, from documents already written, are counted as
+        duplicates. The operations that fail with any other write error are
+        kept in self.failed and the error is raised once the rest are
+        counted. If the write fails as a whole, e.g. the server is
+        unreachable, every operation goes back in the buffer for the next
+        flush.
+
+        Args: None
+
+        Returns: (tuple) documents inserted and duplicates in this flush.
+        """
+        with self._lock:
+            ops, self._ops = self._ops, []
+            _unflushed.discard(self)
+            if not ops:
+                return 0, 0
+            failed = []
+            try:
+                result = self.collection.bulk_write(ops, ordered=False)
+                details = result.bulk_api_result
+            except BulkWriteError as bwe:
+                details = bwe.details
+                errors = details["writeErrors"]
+                failed = [e for e in errors if e["code"] != DUPLICATE_KEY]
+                details["nMatched"] = (
+                    details.get("nMatched", 0) + len(errors) - len(failed)
+                )
+                self.failed.extend(ops[e["index"]] for e in failed)
+                error = bwe
+            except PyMongoError:
+                self._ops = ops
+                _unflushed.add(self)
+                raise
+
+            inserted = details.get("nInserted", 0) + details.get("nUpserted", 0)
+            duplicates = details.get("nMatched", 0)
+            self.inserted += inserted
+            self.duplicates += duplicates
+            self.flushes += 1
+            if failed:
+                raise error
+
+        if self.verbose:
+            print(
+                f"{self.collection.name}: wrote {len(ops)} documents, "
+                f"{inserted} new, {duplicates} duplicates"
+            )
+        return inserted, duplicates
+
+    def close(self):
+        """
+        Flushes the buffer.
+
+        Args: None
+
+        Returns: None
+        """
+        self.flush()
+
+    def report(self):
+        """
+        Describes what has been written so far.
+
+        Args: None
+
+        Returns: (str) one-line summary.
+        """
+        report = (
+            f"{self.collection.name}: {self.inserted} inserted, "
+            f"{self.duplicates} duplicates in {self.flushes} bulk writes"
+        )
+        if self.failed:
+            report += f", {len(self.failed)} failed"
+        return report
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,16 +1,22 @@
 from lyricsgenius import Genius
 from pymongo import MongoClient
+from src.rate_limiter import RateLimiter
+from src.bulk_writer import BulkWriter
+from src import http_cache
+from src.backlog import anti_join, get_field
+from src.my_nlp import lyrics_hash
 import pandas as pd
 import numpy as np
 
 from io import StringIO
-import sys, time
+import sys, time, heapq, threading, re, string
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from functools import reduce
 from operator import add
 
 import traceback as tb
-from requests.exceptions import ReadTimeout
-from pymongo.errors import DuplicateKeyError
+from requests.exceptions import HTTPError, Timeout
 
 
 class Scraper:
@@ -22,23 +28,52 @@ class Scraper:
             genius API client access token. Default is 'data/genius.auth'
         minsleep (float): minimum time to sleep between requests to the 
             genius API. Default is 0.5
+        limiter (RateLimiter): rate limiter for Genius requests, which may be
+            shared with other scrapers. Requests answered by the cache don't
+            wait. Default None, a new one at 1/minsleep requests per second.
+        cache (ResponseCache): cache for Genius responses. In offline mode no
+            access token is needed. Default None, no caching.
+        use_index (bool): reuse the Genius result of an earlier track with
+            the same normalized artist and title from a LyricsIndex instead
+            of searching again. Default True
     """
 
-    def __init__(self, genius_auth_path="data/genius.auth", minsleep=0.5):
+    def __init__(
+        self,
+        genius_auth_path="data/genius.auth",
+        minsleep=0.5,
+        limiter=None,
+        cache=None,
+        use_index=True,
+    ):
 
         # gets client access token
-        with open("data/genius.auth", "r") as file:
-            client_access_token = file.read().strip()
+        if cache is not None and cache.offline:
+            client_access_token = "offline"
+        else:
+            with open("data/genius.auth", "r") as file:
+                client_access_token = file.read().strip()
 
         self.minsleep = minsleep
+        self.limiter = limiter or RateLimiter(rate=1 / minsleep)
         self.api = Genius(client_access_token, remove_section_headers=True)
-        self.lyrics = MongoClient().billboard["lyrics"]
-        self.errlog = MongoClient().billboard["lyrics_errlog"]
+
+        # self.limiter does the waiting between the requests that are sent
+        self.api.sleep_time = 0
+        http_cache.install(self.api._session, cache, self.limiter)
+        self.lyrics = BulkWriter(MongoClient().billboard["lyrics"], stamp="scraped")
+        self.errlog = BulkWriter(MongoClient().billboard["lyrics_errlog"])
+        self.lyrics_index = LyricsIndex(MongoClient().billboard) if use_index else None
         print("Initialized")
 
-    def populate_billboard_scrapables(self):
+    def populate_billboard_scrapables(self, queue=None):
         """
         Identifies billboard tracks to scrape from the spotify collection.
+
+        Args:
+            queue (JobQueue): queue to also add the tracks to as 'lyrics'
+                jobs, for work_queue. Default None
+
         Returns: None. sets self.df
         """
         results = MongoClient().billboard.spotify.find()
@@ -54,24 +89,29 @@ class Scraper:
             columns=["track_id", "artist_name", "title"],
         )
         print(f"Tracks identified to scrape lyrics: {self.df.shape[0]}")
+        if queue is not None:
+            self.enqueue_df(queue)
 
-    def populate_nillboard_scrapables(self):
+    def populate_nillboard_scrapables(self, queue=None):
         """
         Populates tracks to scraped that are not on the billboard
+
+        Args:
+            queue (JobQueue): queue to also add the tracks to as 'lyrics'
+                jobs, for work_queue. Default None
+
         Returns: None. Sets internal state as self.df
         """
 
         # initialize db connection
         db = MongoClient().billboard
 
-        # get the track_ids that have already been scraped.
-        scraped_ids = [r["_id"] for r in db.lyrics.find()] + [
-            r["metadata"]["id"] for r in db.spotify.find()
-        ]
-        print("scraped ids", len(scraped_ids))
-
         # get the entries that have not yet been scraped
-        tracks_cursor = db.spotify_nillboard.find({"_id": {"$nin": scraped_ids}})
+        tracks_cursor = anti_join(
+            db.spotify_nillboard,
+            [(db.lyrics, "_id"), (db.spotify, "metadata.id")],
+            projection={"metadata.artists.name": 1, "metadata.name": 1},
+        )
 
         # unpack the db response cursor
         data = map(
@@ -86,6 +126,51 @@ class Scraper:
         # set internal dataframe to be scraped
         self.df = pd.DataFrame(data, columns=["track_id", "artist_name", "title"])
         print(f"Tracks identified to scrape lyrics: {self.df.shape[0]}")
+        if queue is not None:
+            self.enqueue_df(queue)
+
+    def enqueue_df(self, queue):
+        """
+        Adds the tracks in self.df to a shared queue as 'lyrics' jobs.
+
+        Args:
+            queue (JobQueue): the queue
+
+        Returns: None
+        """
+        added = queue.enqueue(
+            "lyrics",
+            ((row["track_id"], row) for row in self.df.to_dict("records")),
+        )
+        print(f"Jobs queued: {added}")
+
+    def work_queue(self, queue, batch_size=200, workers=1, verbose=1):
+        """
+        Scrapes 'lyrics' jobs from a shared queue, batch_size at a time,
+        until none are left. Any number of processes can work the same queue.
+
+        Args:
+            queue (JobQueue): queue filled by populate_billboard_scrapables
+                or populate_nillboard_scrapables
+            batch_size (int): jobs claimed at once. Default 200
+            workers (int): threads per batch, as in scrape_df_parallel.
+                Default 1
+            verbose (int): verbosity level. Higher verbosity, more prints.
+
+        Returns: None. Puts genius data in billboard.lyrics and errors in
+            billboard.lyrics_errlog when needed.
+        """
+        while True:
+            with queue.lease("lyrics", batch_size) as jobs:
+                if not jobs:
+                    break
+                self.df = pd.DataFrame([job["payload"] for job in jobs])
+                if workers > 1:
+                    self.scrape_df_parallel(workers=workers, verbose=verbose)
+                else:
+                    self.scrape_df_segment_to_db(range(self.df.shape[0]), verbose)
+            if verbose:
+                print(queue.counts("lyrics"))
 
     def scrape_df_segment_to_db(self, scraperange, verbose=1):
         """
@@ -100,37 +185,199 @@ class Scraper:
             billboard.lyrics_errlog when needed.
         """
 
-        for i in scraperange:
+        try:
+            for i in scraperange:
+                row = self.df.iloc[i]
+                try:
+                    self.scrape_song_to_db(
+                        row["artist_name"], row["title"], row["track_id"]
+                    )
+
+                # record error and continue
+                except TypeError as e:
+                    self.record_error(row["track_id"], "TypeError")
+
+                if verbose > 1:
+                    print(i)
+
+        # tracks already scraped to the db are skipped by the bulk writes
+        finally:
+            self.flush_writes(verbose)
+
+    def scrape_df_parallel(self, workers=4, retries=3, backoff=1.0, verbose=1):
+        """
+        Scrapes all of self.df to the database on several threads. The rows
+        are split evenly across the workers, which share self.api's session
+        and self.limiter. Each worker keeps its rows in a queue ordered by
+        when they may next be tried, so a song that timed out waits out its
+        backoff at the back of the queue instead of holding up the rest.
+
+        Args:
+            workers (int): number of threads. Default 4
+            retries (int): max retries of a song after a timeout or rate
+                limit. Default 3
+            backoff (float): seconds before the first retry, doubling with
+                each further retry. Default 1.0
+            verbose (int): verbosity level. Higher verbosity, more prints.
+
+        Returns: (list of dicts) per worker, the songs scraped, songs that
+            failed or ran out of retries, seconds taken and songs scraped
+            per second.
+        """
+        segments = np.array_split(np.arange(self.df.shape[0]), workers)
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                stats = list(
+                    pool.map(
+                        lambda k: self._scrape_worker(
+                            k, segments[k], retries, backoff, verbose
+                        ),
+                        range(workers),
+                    )
+                )
+            if verbose:
+                for k, stat in enumerate(stats):
+                    print(
+                        f"worker {k}: {stat['songs']} songs, {stat['failed']} "
+                        f"failed in {stat['seconds']:.1f}s, {stat['rate']:.2f}/s"
+                    )
+                print(self.limiter.report())
+
+        # tracks already scraped to the db are skipped by the bulk writes
+        finally:
+            self.flush_writes(verbose)
+        return stats
+
+    def flush_writes(self, verbose=1):
+        """
+        Writes out the buffered lyrics, errors and index entries.
+
+        Args:
+            verbose (int): how much to print. Default 1
+
+        Returns: None
+        """
+        writers = [self.lyrics, self.errlog]
+        if self.lyrics_index is not None:
+            writers.append(self.lyrics_index.writer)
+        for writer in writers:
+            writer.flush()
+            if verbose:
+                print(writer.report())
+        if verbose and self.lyrics_index is not None:
+            print(self.lyrics_index.report())
+
+    def _scrape_worker(self, k, segment, retries, backoff, verbose):
+        """
+        Helper method for scrape_df_parallel that scrapes one worker's rows.
+        A row that fails with an unexpected error has the error logged and
+        is tried again later, like a timeout, so one bad row does not stop
+        the worker.
+
+        Args:
+            k (int): worker number
+            segment (iterable): indices of self.df for this worker
+            retries (int): max retries of a song
+            backoff (float): seconds before the first retry
+            verbose (int): verbosity level
+
+        Returns: (dict) songs scraped, songs failed, seconds taken and songs
+            scraped per second.
+        """
+        start = time.monotonic()
+        queue = [(start, i, 0) for i in segment]
+        heapq.heapify(queue)
+        songs = failed = 0
+        while queue:
+            ready, i, attempt = heapq.heappop(queue)
+            wait = ready - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
             row = self.df.iloc[i]
             try:
-                self.scrape_song_to_db(
+                retry = self._scrape_song(
                     row["artist_name"], row["title"], row["track_id"]
                 )
-
-            # record error and continue
-            except TypeError as e:
+                error = False
+            except TypeError:
                 self.record_error(row["track_id"], "TypeError")
-
-            # track has already been scraped to the db - print and continue
-            except DuplicateKeyError:
-                if verbose:
-                    print(f"Duplicate skipped on index {i}")
-
+                retry, error = False, True
+
+            # log any other failure and requeue the row
+            except Exception as e:
+                print(f"worker {k}: {row['track_id']} failed: {e!r}")
+                self.record_error(row["track_id"], type(e).__name__)
+                retry = error = True
+
+            if retry and attempt < retries:
+                ready = time.monotonic() + backoff * 2**attempt
+                heapq.heappush(queue, (ready, i, attempt + 1))
+                continue
+
+            # out of retries counts as a failure, not a scraped song
+            if retry or error:
+                failed += 1
+            else:
+                songs += 1
             if verbose > 1:
-                print(i)
+                print(f"worker {k}: {i}")
 
-    def scrape_song_to_db(self, artist, title, track_id):
+        seconds = time.monotonic() - start
+        return {
+            "songs": songs,
+            "failed": failed,
+            "seconds": seconds,
+            "rate": songs / max(seconds, 1e-9),
+        }
+
+    def scrape_song_to_db(self, artist, title, track_id, retries=3, backoff=1.0):
         """
-        Scrapes a single track to the database. 
+        Scrapes a single track to the database, retrying after timeouts and
+        rate limits. A track with the normalized artist and title of one
+        already in self.lyrics_index reuses its result without a search.
 
         Args: 
             artist (str): the artist name
             title (str): the title of the track
             track_id (str): the id of the track to be used as the mongodb _id 
+            retries (int): max retries. Default 3
+            backoff (float): seconds before the first retry, doubling with
+                each further retry. Default 1.0
 
         Returns: None. Adds a track to the lyrics collection, or lyrics_errlog 
         if needed. 
         """
+        for attempt in range(retries + 1):
+            if not self._scrape_song(artist, title, track_id):
+                return
+            if attempt < retries:
+                time.sleep(backoff * 2**attempt)
+
+    def _scrape_song(self, artist, title, track_id):
+        """
+        Makes one attempt at scraping a track to the database.
+
+        Args: 
+            artist (str): the artist name
+            title (str): the title of the track
+            track_id (str): the id of the track to be used as the mongodb _id 
+
+        Returns: (bool) True if the attempt timed out or was rate limited and
+            should be retried. The failure is recorded in lyrics_errlog.
+        """
+
+        # another version of the same song was already searched for
+        if self.lyrics_index is not None:
+            key = LyricsIndex.key(artist, title)
+            known = self.lyrics_index.lookup(key)
+            if known is not None:
+                if "lyrics" in known:
+                    source = known.get("reused_from", known["_id"])
+                    self.record_lyrics_doc(track_id, known, reused_from=source)
+                else:
+                    self.record_error(track_id, known["error"])
+                return False
 
         # remove featured artist names
         artist = stripFeat(artist)
@@ -141,43 +388,65 @@ class Scraper:
                 songdata = self.api.search_song(title, artist)
 
         # for the few errors that have been raised
-        except ReadTimeout:
-            self.api.sleep_time += 3
-            print(f"sleep time increased to {self.api.sleep_time}")
+        except Timeout:
+            self.limiter.throttled()
+            print(self.limiter.report())
             self.record_error(track_id, "ReadTimeout")
-            self.scrape_song_to_db(artist, title, track_id)
-            return
-
-        # take sleep time slowly back to minimum
-        if self.api.sleep_time > self.minsleep:
-            self.api.sleep_time -= 0.25
-            print(f"sleep time decreased to {self.api.sleep_time}")
+            return True
+
+        # rate limited: back off for as long as Genius asks
+        except HTTPError as e:
+            status, retry_after = http_error_details(e)
+            if status != 429:
+                raise
+            self.limiter.throttled(retry_after)
+            print(self.limiter.report())
+            self.record_error(track_id, "RateLimited")
+            return True
+
+        # timeouts slow the shared rate down, anything else speeds it up
+        timed_out = songdata == None and output[1].startswith("Timeout")
+        if timed_out:
+            self.limiter.throttled()
+            print(self.limiter.report())
+        else:
+            self.limiter.success()
 
         # search successful
         if songdata != None:
-            self.record_lyrics_result(track_id, songdata)
+            doc = self.record_lyrics_result(track_id, songdata)
+            if self.lyrics_index is not None:
+                self.lyrics_index.add(key, doc)
+            return False
 
         # handle (record & retry) Timeout error
-        elif output[1].startswith("Timeout"):
-            self.api.sleep_time += 3
+        elif timed_out:
             self.record_error(track_id, "Timeout")
-            self.scrape_song_to_db(artist, title, track_id)
-            return
+            return True
 
         # record error: not in genius db
         elif output[1].startswith("No results"):
-            self.record_error(track_id, "no_results")
+            error = "no_results"
 
         # record error: song without lyrics
         elif output[1] == "Specified song does not contain lyrics. Rejecting.":
-            self.record_error(track_id, "lacks_lyrics")
+            error = "lacks_lyrics"
 
         # record error: URL issue
         elif (
             output[1]
             == "Specified song does not have a valid URL with lyrics. Rejecting."
         ):
-            self.record_error(track_id, "invalid_url")
+            error = "invalid_url"
+
+        else:
+            return False
+
+        # searching again for another version would fail the same way
+        self.record_error(track_id, error)
+        if self.lyrics_index is not None:
+            self.lyrics_index.add_error(key, error)
+        return False
 
     def record_lyrics_result(self, track_id, songdata):
         """
@@ -187,17 +456,44 @@ class Scraper:
             track_id (str): spotify track id to be the mongodb _id
             songdata (dict): contains track data in keys 'artist', 'title', and 'lyrics'
 
-        Returns: None. A song is inserted into the lyrics collection.
+        Returns: (dict) the document queued for the lyrics collection.
         """
-        self.lyrics.insert_one(
+        return self.record_lyrics_doc(
+            track_id,
             {
-                "_id": track_id,
                 "response_artist": songdata.artist,
                 "response_title": songdata.title,
                 "lyrics": songdata.lyrics,
-            }
+            },
         )
 
+    def record_lyrics_doc(self, track_id, songdoc, reused_from=None):
+        """
+        Inserts a track's lyrics to the lyrics collection, from the fields
+        of a Genius result, with the hash of the lyrics that scores are
+        shared by.
+
+        Args:
+            track_id (str): spotify track id to be the mongodb _id
+            songdoc (dict): contains the keys 'response_artist',
+                'response_title' and 'lyrics'
+            reused_from (str): track id of the lyrics document the result
+                was taken from instead of searching Genius. Default None
+
+        Returns: (dict) the document queued for the lyrics collection.
+        """
+        doc = {
+            "_id": track_id,
+            "response_artist": songdoc["response_artist"],
+            "response_title": songdoc["response_title"],
+            "lyrics": songdoc["lyrics"],
+            "lyrics_hash": lyrics_hash(songdoc["lyrics"]),
+        }
+        if reused_from is not None:
+            doc["reused_from"] = reused_from
+        self.lyrics.add(doc)
+        return doc
+
     def record_error(self, track_id, errtype):
         """
         Inserts the record of an error into the errlog collection.
@@ -206,9 +502,9 @@ class Scraper:
             track_id (str): id of the track this error occurred on
             errtype (str): type of error that occurred.
 
-        Returns: None. Inserts 1 record into the errlog collection
+        Returns: None. Queues 1 record for the errlog collection
         """
-        self.errlog.insert_one({"track": track_id, "type": errtype})
+        self.errlog.add({"track": track_id, "type": errtype})
 
     def record_error_verbose(self, track_id, errmsg):
         """
@@ -218,11 +514,232 @@ class Scraper:
             track_id (str): id of the track this error occurred on
             errmsg (str): error message to record
 
-        Returns: None. An error of type 'verbose' is inserted into the errlog collection.
+        Returns: None. An error of type 'verbose' is queued for the errlog collection.
         """
-        self.errlog.insert_one(
-            {"track": track_id, "type": "verbose", "message": errmsg}
-        )
+        self.errlog.add({"track": track_id, "type": "verbose", "message": errmsg})
+
+
+# Spotify edition tags for releases of a song with the same recording and
+# lyrics, e.g. 'Song - 2011 Remaster', 'Song (feat. Artist)' or 'Song [Clean]'.
+# Live, remix, edit, acoustic, language and 'with' versions are kept apart.
+_EDITION_TAG = r"""
+    (?:\d{4}\s+)?(?:digital(?:ly)?\s+)?remaster(?:ed)?(?:\s+\d{4})?(?:\s+version)?
+    | (?:clean|explicit|mono|stereo)(?:\s+version)?
+    | deluxe(?:\s+(?:edition|version))?
+    | (?:feat|ft)\.?\s[^()\[\]]+
+    | featuring\s[^()\[\]]+
+"""
+_EDITION_TAGS = rf"(?:{_EDITION_TAG})(?:\s*[/;,]\s*(?:{_EDITION_TAG}))*"
+VERSION_RE = re.compile(
+    rf"""
+    \s*\(\s*{_EDITION_TAGS}\s*\)
+    | \s*\[\s*{_EDITION_TAGS}\s*\]
+    | \s+-\s+{_EDITION_TAGS}\s*$
+    """,
+    re.IGNORECASE | re.VERBOSE,
+)
+
+
+class LyricsIndex:
+    """
+    Index of Genius results by normalized artist and title, so the tracks
+    of deluxe editions, clean and explicit pairs, mono and stereo mixes and
+    remasters share one Genius search. Each key maps to the _id of the lyrics document
+    the result was saved under, or to the error type of a search that found
+    no lyrics. The index is kept in billboard.lyrics_index and built from
+    billboard.lyrics and billboard.lyrics_errlog the first time. Safe to
+    share across threads.
+
+    Args:
+        db (pymongo Database): the billboard database
+        max_songs (int): recent lyrics documents kept in memory, for reuse
+            before they are written out. Default 10000
+    """
+
+    # errors that searching again would only repeat
+    PERMANENT_ERRORS = ("no_results", "lacks_lyrics", "invalid_url")
+
+    def __init__(self, db, max_songs=10000):
+        self.db = db
+        self.collection = db["lyrics_index"]
+        self.writer = BulkWriter(self.collection)
+        self.max_songs = max_songs
+        self.refs = None
+        self.songs = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(artist, title):
+        """
+        Normalizes an artist and title into an index key: featured artists,
+        edition tags (see VERSION_RE), case, punctuation and extra whitespace
+        are dropped.
+
+        Args:
+            artist (str): artist name as on Spotify
+            title (str): track title as on Spotify
+
+        Returns: (str) the key.
+        """
+        strip = str.maketrans("", "", string.punctuation)
+        title = VERSION_RE.sub("", title)
+        artist = " ".join(stripFeat(artist).casefold().translate(strip).split())
+        title = " ".join(title.casefold().translate(strip).split())
+        return f"{artist}\t{title}"
+
+    def load(self):
+        """
+        Reads the index into memory, building it first if it is empty.
+        Called with the lock held.
+
+        Args: None
+
+        Returns: None
+        """
+        self.refs = {e["_id"]: e for e in self.collection.find()}
+        if not self.refs:
+            self.build()
+
+    def build(self):
+        """
+        Builds the index from the tracks already scraped: those saved in
+        billboard.lyrics and those logged in billboard.lyrics_errlog with a
+        permanent error, keyed by their Spotify artist and title.
+
+        Args: None
+
+        Returns: None
+        """
+        scraped = {doc["_id"] for doc in self.db.lyrics.find({}, {"_id": 1})}
+        failed = {
+            e["track"]: e["type"]
+            for e in self.db.lyrics_errlog.find(
+                {"type": {"$in": list(self.PERMANENT_ERRORS)}}, {"track": 1, "type": 1}
+            )
+        }
+        sources = [
+            (self.db.spotify, "metadata.id"),
+            (self.db.spotify_nillboard, "_id"),
+        ]
+        refs = dict()
+        for collection, field in sources:
+            projection = {field: 1, "metadata.artists.name": 1, "metadata.name": 1}
+            for doc in collection.find({}, projection):
+                track_id = get_field(doc, field)
+                metadata = doc["metadata"]
+                key = self.key(metadata["artists"][0]["name"], metadata["name"])
+                if track_id in scraped:
+                    refs[key] = {"_id": key, "ref": track_id}
+                elif track_id in failed:
+                    refs.setdefault(key, {"_id": key, "error": failed[track_id]})
+        self.refs = refs
+        self.writer.extend(refs.values())
+        self.writer.flush()
+
+    def lookup(self, key):
+        """
+        Finds the Genius result already known for key.
+
+        Args:
+            key (str): index key
+
+        Returns: (dict) the lyrics document the result was saved under, or
+            a dict with the error type of a failed search, or None if the
+            key is not in the index.
+        """
+        with self._lock:
+            if self.refs is None:
+                self.load()
+            entry = self.refs.get(key)
+            song = self.songs.get(entry.get("ref")) if entry else None
+            if song is not None:
+                self.songs.move_to_end(entry["ref"])
+
+        # results not kept in memory are read back from billboard.lyrics
+        if entry is not None and "ref" in entry and song is None:
+            song = self.db.lyrics.find_one(
+                {"_id": entry["ref"]},
+                {"response_artist": 1, "response_title": 1, "lyrics": 1},
+            )
+        found = song if entry is None or "ref" in entry else entry
+        with self._lock:
+            if found is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return found
+
+    def add(self, key, doc):
+        """
+        Records a Genius result.
+
+        Args:
+            key (str): index key
+            doc (dict): lyrics document the result was saved under
+
+        Returns: None
+        """
+        entry = {"_id": key, "ref": doc["_id"]}
+        with self._lock:
+            if self.refs is None:
+                self.load()
+            self.refs[key] = entry
+            self.songs[doc["_id"]] = doc
+            if len(self.songs) > self.max_songs:
+                self.songs.popitem(last=False)
+        self.writer.add(entry)
+
+    def add_error(self, key, error):
+        """
+        Records a search that found no lyrics.
+
+        Args:
+            key (str): index key
+            error (str): error type, one of PERMANENT_ERRORS
+
+        Returns: None
+        """
+        entry = {"_id": key, "error": error}
+        with self._lock:
+            if self.refs is None:
+                self.load()
+            self.refs.setdefault(key, entry)
+        self.writer.add(entry)
+
+    def report(self):
+        """
+        Describes how many searches the index saved.
+
+        Args: None
+
+        Returns: (str) one-line summary.
+        """
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0.0
+        return f"lyrics index: {self.hits}/{lookups} hits ({rate:.0%})"
+
+
+def http_error_details(e):
+    """
+    Gets the status code and Retry-After header of an HTTPError. lyricsgenius
+    raises HTTPError(status_code, message) without a response, chained to
+    the original error that has one.
+
+    Args:
+        e (requests HTTPError): the error
+
+    Returns: (int, str) the status code, or None if unknown, and the
+        Retry-After value, or None if there is none.
+    """
+    response = e.response
+    if response is None and isinstance(e.__cause__, HTTPError):
+        response = e.__cause__.response
+    if response is not None:
+        return response.status_code, response.headers.get("Retry-After")
+    status = e.args[0] if e.args and isinstance(e.args[0], int) else None
+    return status, None
 
 
 def stripFeat(s):
@@ -246,18 +763,22 @@ class Capturing(list):
     """
     Captures stdout as a list. Needed for error handling with lyricsgenius 
     because those errors are simpy printed. Meant to be used in with as blocks.
+    Only output from the thread that entered the block is captured, so
+    scraper threads can capture at the same time.
     """
 
     def __enter__(self):
         """
-        Starts redirecting stdout. 
+        Starts redirecting stdout for this thread. 
 
         Args: None
 
         Returns: self 
         """
-        self._stdout = sys.stdout
-        sys.stdout = self._stringio = StringIO()
+        if not isinstance(sys.stdout, ThreadStdout):
+            sys.stdout = ThreadStdout(sys.stdout)
+        self._stringio = StringIO()
+        self._previous = sys.stdout.redirect(self._stringio)
         return self
 
     def __exit__(self, *args):
@@ -271,9 +792,45 @@ class Capturing(list):
         Returns: None, but this object is ready to use as a list of the
         output lines.
         """
+        sys.stdout.redirect(self._previous)
         self.extend(self._stringio.getvalue().splitlines())
         del self._stringio  # free up some memory
-        sys.stdout = self._stdout
+
+
+class ThreadStdout:
+    """
+    Stand-in for sys.stdout that sends each thread's output to that thread's
+    redirect, if it has one, and otherwise to the real stdout.
+
+    Args:
+        stdout (file): the real stdout
+    """
+
+    def __init__(self, stdout):
+        self.stdout = stdout
+        self._local = threading.local()
+
+    def redirect(self, target):
+        """
+        Sends this thread's output to target.
+
+        Args:
+            target (file): where to write, or None for the real stdout
+
+        Returns: the previous target of this thread.
+        """
+        previous = getattr(self._local, "target", None)
+        self._local.target = target
+        return previous
+
+    def write(self, s):
+        return (getattr(self._local, "target", None) or self.stdout).write(s)
+
+    def flush(self):
+        (getattr(self._local, "target", None) or self.stdout).flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stdout, name)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,298 @@
+import json, sqlite3, threading, time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+CACHE_TABLE = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY, url TEXT, status INTEGER, headers TEXT, body BLOB,
+    size INTEGER, stored REAL, accessed REAL
+)
+"""
+
+
+class OfflineCacheMiss(requests.ConnectionError):
+    """
+    Raised in offline mode for a request the cache cannot answer.
+    """
+
+
+class ResponseCache:
+    """
+    Disk-backed cache of HTTP responses in SQLite, shared by the scrapers so
+    reruns replay earlier answers instead of calling the APIs again. Only
+    successful GET responses are stored, keyed by the normalized request
+    (method, lowercased host, path and sorted query parameters), so auth
+    headers and parameter order don't matter. Entries older than ttl are
+    ignored, and the least recently used entries are evicted once the
+    bodies take up more than max_bytes. In offline mode nothing is sent and
+    a miss raises OfflineCacheMiss. Safe to share across threads.
+
+    Args:
+        path (str): SQLite database file. Default 'data/http_cache.sqlite'
+        ttl (float): seconds a response stays fresh, or None to never
+            expire. Default 30 days
+        max_bytes (int): total body size kept before evicting. Default 1 GB
+        offline (bool): replay only from the cache. Default False
+    """
+
+    def __init__(
+        self,
+        path="data/http_cache.sqlite",
+        ttl=30 * 24 * 3600,
+        max_bytes=2**30,
+        offline=False,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(CACHE_TABLE)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+        self._conn.commit()
+        self._size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(method, url):
+        """
+        Normalizes a request into a cache key.
+
+        Args:
+            method (str): HTTP method
+            url (str): full request URL
+
+        Returns: (str) the key.
+        """
+        parts = urlsplit(url)
+        query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+        url = urlunsplit((parts.scheme, parts.netloc.lower(), parts.path, query, ""))
+        return f"{method.upper()} {url}"
+
+    def get(self, key):
+        """
+        Looks up a fresh response.
+
+        Args:
+            key (str): key from ResponseCache.key
+
+        Returns: (tuple) status, headers dict and body bytes, or None on a
+            miss.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, headers, body, stored FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None or (self.ttl is not None and now - row[3] > self.ttl):
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+        return row[0], json.loads(row[1]), row[2]
+
+    def put(self, key, url, status, headers, body):
+        """
+        Stores a response, evicting the least recently used ones if the
+        cache is over max_bytes.
+
+        Args:
+            key (str): key from ResponseCache.key
+            url (str): request URL, kept for inspection
+            status (int): HTTP status code
+            headers (dict): response headers
+            body (bytes): response body
+
+        Returns: None
+        """
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, status, json.dumps(headers), body, len(body), now, now),
+            )
+            self._size += len(body) - (old[0] if old else 0)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """
+        Deletes expired entries, then least recently used ones, until the
+        bodies fit in max_bytes. Called with the lock held.
+
+        Args: None
+
+        Returns: None
+        """
+        if self._size <= self.max_bytes:
+            return
+        if self.ttl is not None:
+            self._conn.execute(
+                "DELETE FROM responses WHERE stored < ?", (time.time() - self.ttl,)
+            )
+        self._size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        while self._size > self.max_bytes:
+            oldest = self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed LIMIT 100"
+            ).fetchall()
+            for key, size in oldest:
+                if self._size <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._size -= size
+
+    def report(self):
+        """
+        Describes the cache's hit rate and size.
+
+        Args: None
+
+        Returns: (str) one-line summary.
+        """
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0.0
+        return (
+            f"http cache: {self.hits}/{lookups} hits ({rate:.0%}), "
+            f"{self._size / 2**20:.1f} MB stored"
+        )
+
+    def close(self):
+        """
+        Closes the database connection.
+
+        Args: None
+
+        Returns: None
+        """
+        with self._lock:
+            self._conn.close()
+
+
+class LimitedAdapter(HTTPAdapter):
+    """
+    Transport adapter that takes a token from a RateLimiter before sending
+    each request, so every request that reaches the network is paced,
+    however many a client library makes per call.
+
+    Args:
+        limiter (RateLimiter): limiter to take tokens from, or None to send
+            without waiting. Default None
+        kwargs: passed on to HTTPAdapter, e.g. max_retries
+    """
+
+    def __init__(self, limiter=None, **kwargs):
+        self.limiter = limiter
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if self.limiter is not None:
+            self.limiter.acquire()
+        return super().send(request, **kwargs)
+
+
+class CachingAdapter(LimitedAdapter):
+    """
+    Transport adapter that answers GET requests from a ResponseCache and
+    stores successful responses in it. Other requests are sent as usual,
+    except in offline mode, where they raise OfflineCacheMiss. Only requests
+    that are sent take a token from the limiter; cache hits and offline
+    replays don't wait.
+
+    Args:
+        cache (ResponseCache): the cache
+        limiter (RateLimiter): limiter for the requests that miss the cache.
+            Default None
+        kwargs: passed on to HTTPAdapter, e.g. max_retries
+    """
+
+    def __init__(self, cache, limiter=None, **kwargs):
+        self.cache = cache
+        super().__init__(limiter, **kwargs)
+
+    def send(self, request, **kwargs):
+        key = ResponseCache.key(request.method, request.url)
+        if request.method == "GET":
+            cached = self.cache.get(key)
+            if cached is not None:
+                return self._replay(request, *cached)
+        if self.cache.offline:
+            raise OfflineCacheMiss(f"not in cache: {key}", request=request)
+
+        response = super().send(request, **kwargs)
+        if request.method == "GET" and response.status_code == 200:
+            self.cache.put(
+                key,
+                request.url,
+                response.status_code,
+                dict(response.headers),
+                response.content,
+            )
+        return response
+
+    def _replay(self, request, status, headers, body):
+        """
+        Builds a requests Response from a cached one.
+
+        Args:
+            request (PreparedRequest): the request being answered
+            status (int): HTTP status code
+            headers (dict): response headers
+            body (bytes): response body
+
+        Returns: (requests.Response) the response.
+        """
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = body
+        response.url = request.url
+        response.request = request
+        response.reason = "OK"
+        response.connection = self
+        return response
+
+
+def install(session, cache, limiter=None):
+    """
+    Routes a requests session through a ResponseCache and a RateLimiter,
+    keeping the retry settings of the adapters it replaces. Requests the
+    cache answers don't take a token from the limiter.
+
+    Args:
+        session (requests.Session): session to cache, e.g. a spotipy
+            client's _session
+        cache (ResponseCache): the cache, or None to only rate limit
+        limiter (RateLimiter): limiter for the requests that are sent.
+            Default None, no limit
+
+    Returns: the session.
+    """
+    for prefix in ("http://", "https://"):
+        retries = session.get_adapter(prefix).max_retries
+        if cache is None:
+            adapter = LimitedAdapter(limiter, max_retries=retries)
+        else:
+            adapter = CachingAdapter(cache, limiter, max_retries=retries)
+        session.mount(prefix, adapter)
+    return session
@@ -0,0 +1,241 @@
+import socket, os, threading, uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pymongo import MongoClient, ASCENDING
+from src.bulk_writer import BulkWriter
+
+
+class JobQueue:
+    """
+    Scrape backlog shared by any number of scraper processes through a
+    MongoDB collection. Jobs are enqueued once per (kind, key), claimed in
+    batches under a lease that the worker renews with heartbeats, and marked
+    done or failed when processed. A lease that runs out, because its worker
+    died or hung, puts its jobs back up for claiming, and failed jobs are
+    retried until max_attempts.
+
+    Each job document has the fields _id ('kind:key'), kind, key, payload,
+    state ('queued', 'leased', 'done' or 'failed'), attempts, worker, token,
+    lease_until, error and updated.
+
+    Args:
+        db (pymongo Database): database for the queue. Default None, the
+            local billboard database.
+        name (str): collection name. Default 'scrape_jobs'
+        lease_time (float): seconds a claim lasts without a heartbeat.
+            Default 300
+        max_attempts (int): claims of a job before it is left failed.
+            Default 3
+        worker (str): name recorded on claimed jobs. Default host:pid
+    """
+
+    def __init__(
+        self, db=None, name="scrape_jobs", lease_time=300, max_attempts=3, worker=None
+    ):
+        db = db if db is not None else MongoClient().billboard
+        self.jobs = db[name]
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        self.worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+        self.jobs.create_index([("kind", ASCENDING), ("state", ASCENDING)])
+        self.jobs.create_index([("token", ASCENDING)])
+
+    def enqueue(self, kind, jobs):
+        """
+        Adds jobs that are not already in the queue. Jobs already queued,
+        leased, done or failed are left as they are.
+
+        Args:
+            kind (str): job type, e.g. 'spotify_bb'
+            jobs (iterable): (key, payload) pairs, with key a unique str and
+                payload a dict for the worker.
+
+        Returns: (int) number of new jobs.
+        """
+        now = datetime.utcnow()
+        with BulkWriter(self.jobs, batch_size=5000) as writer:
+            for key, payload in jobs:
+                writer.add(
+                    {
+                        "_id": f"{kind}:{key}",
+                        "kind": kind,
+                        "key": key,
+                        "payload": payload,
+                        "state": "queued",
+                        "attempts": 0,
+                        "updated": now,
+                    }
+                )
+        return writer.inserted
+
+    def claim(self, kind, n=50):
+        """
+        Leases up to n queued jobs, or jobs whose lease ran out, to this
+        worker. Jobs are claimed with a single update, so two workers never
+        hold the same job.
+
+        Args:
+            kind (str): job type
+            n (int): max jobs to claim. Default 50
+
+        Returns: (str, list of dicts) the lease token and the claimed jobs,
+            empty when none are available.
+        """
+        token = uuid.uuid4().hex
+        while True:
+            now = datetime.utcnow()
+
+            # leases that ran out on their last attempt are given up on
+            self.jobs.update_many(
+                {
+                    "kind": kind,
+                    "state": "leased",
+                    "lease_until": {"$lt": now},
+                    "attempts": {"$gte": self.max_attempts},
+                },
+                {"$set": {"state": "failed", "error": "lease expired", "updated": now}},
+            )
+            available = {
+                "kind": kind,
+                "attempts": {"$lt": self.max_attempts},
+                "$or": [
+                    {"state": "queued"},
+                    {"state": "leased", "lease_until": {"$lt": now}},
+                ],
+            }
+            ids = [job["_id"] for job in self.jobs.find(available, {"_id": 1}).limit(n)]
+            if not ids:
+                return token, []
+            self.jobs.update_many(
+                {"_id": {"$in": ids}, **available},
+                {
+                    "$set": {
+                        "state": "leased",
+                        "token": token,
+                        "worker": self.worker,
+                        "lease_until": now + timedelta(seconds=self.lease_time),
+                        "updated": now,
+                    },
+                    "$inc": {"attempts": 1},
+                },
+            )
+            claimed = list(self.jobs.find({"token": token, "state": "leased"}))
+
+            # another worker got all of them first; try the next ones
+            if claimed:
+                return token, claimed
+
+    def heartbeat(self, token):
+        """
+        Extends the lease on the jobs claimed with token.
+
+        Args:
+            token (str): lease token from claim
+
+        Returns: (int) jobs still held.
+        """
+        now = datetime.utcnow()
+        result = self.jobs.update_many(
+            {"token": token, "state": "leased"},
+            {
+                "$set": {
+                    "lease_until": now + timedelta(seconds=self.lease_time),
+                    "updated": now,
+                }
+            },
+        )
+        return result.matched_count
+
+    def complete(self, token, keys=None):
+        """
+        Marks claimed jobs done.
+
+        Args:
+            token (str): lease token from claim
+            keys (list of str): keys of the jobs to mark. Default None, all
+                jobs still held under token.
+
+        Returns: None
+        """
+        self._finish(token, keys, {"state": "done", "error": None})
+
+    def fail(self, token, error, keys=None):
+        """
+        Records an error on claimed jobs and releases them. They are claimed
+        again later unless they are out of attempts, in which case they stay
+        failed.
+
+        Args:
+            token (str): lease token from claim
+            error (str): error description
+            keys (list of str): keys of the jobs to mark. Default None, all
+                jobs still held under token.
+
+        Returns: None
+        """
+        self._finish(token, keys, {"state": "failed", "error": error})
+        self.jobs.update_many(
+            {"token": token, "state": "failed", "attempts": {"$lt": self.max_attempts}},
+            {"$set": {"state": "queued"}},
+        )
+
+    def _finish(self, token, keys, fields):
+        """
+        Helper method for complete and fail that sets fields on held jobs.
+        """
+        query = {"token": token, "state": "leased"}
+        if keys is not None:
+            query["key"] = {"$in": list(keys)}
+        fields = dict(fields, updated=datetime.utcnow(), lease_until=None)
+        self.jobs.update_many(query, {"$set": fields})
+
+    @contextmanager
+    def lease(self, kind, n=50):
+        """
+        Claims a batch of jobs and keeps its lease alive on a background
+        thread while the block runs. Jobs still held when the block ends are
+        marked done, or failed with the exception if it raised.
+
+            with queue.lease("spotify_bb") as jobs:
+                for job in jobs:
+                    ...
+
+        Args:
+            kind (str): job type
+            n (int): max jobs to claim. Default 50
+
+        Returns: (list of dicts) the claimed jobs, possibly empty.
+        """
+        token, jobs = self.claim(kind, n)
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.lease_time / 3):
+                self.heartbeat(token)
+
+        beater = threading.Thread(target=beat, daemon=True)
+        beater.start()
+        try:
+            yield jobs
+        except BaseException as e:
+            self.fail(token, repr(e))
+            raise
+        else:
+            self.complete(token)
+        finally:
+            stop.set()
+            beater.join()
+
+    def counts(self, kind=None):
+        """
+        Counts jobs by state.
+
+        Args:
+            kind (str): job type, or None for all jobs. Default None
+
+        Returns: (dict) state to number of jobs.
+        """
+        pipeline = [{"$group": {"_id": "$state", "n": {"$sum": 1}}}]
+        if kind is not None:
+            pipeline.insert(0, {"$match": {"kind": kind}})
+        return {row["_id"]: row["n"] for row in self.jobs.aggregate(pipeline)}
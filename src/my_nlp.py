@@ -1,20 +1,113 @@
-import nltk
-from nltk.corpus import opinion_lexicon
-from nltk.tokenize import treebank
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from concurrent.futures import ProcessPoolExecutor
+from collections import Counter, deque
+from functools import cached_property, lru_cache
+from itertools import repeat
+from array import array
+import numpy as np
+import hashlib, os, pickle, re, time
 
-nltk.download("opinion_lexicon")
+# opinion lexicon precompiled from NLTK's corpus by build_lexicon
+LEXICON_PATH = "data/opinion_lexicon.pickle"
+
+
+# characters and sequences the Treebank tokenizer always splits off as tokens
+_PUNCT = r"""[;@#$%&?!()\[\]{}<>"] | [:,](?!\d) | -- | \.\.\. | '' | ``"""
+
+# the final period of a text, which Treebank also splits off
+_FINAL_PERIOD = r"""(?<!\.)\.(?=[\])}>"']*\s*\Z)"""
+
+# contraction suffixes, which Treebank splits off when a space, split-off
+# punctuation or the end of the text follows
+_SUFFIX = rf"""(?:n't|'ll|'re|'ve|'s|'m|'d|')(?=\ |{_PUNCT}|{_FINAL_PERIOD}|\Z)"""
+
+# whitespace, a split-off suffix or punctuation, or the end of the text
+_BREAK = rf"""(?:\s|{_PUNCT}|{_FINAL_PERIOD}|{_SUFFIX}|\Z)"""
+
+# first halves of the words Treebank splits in two, e.g. gon|na
+_CONTRACTION = rf"""
+    \b(?:can(?=not(?:\b|{_SUFFIX}))|gon(?=na(?:\b|{_SUFFIX}))|got(?=ta(?:\b|{_SUFFIX}))
+    |[gl]im(?=me(?:\b|{_SUFFIX}))|wan(?=na{_BREAK}))
+"""
+
+# part of a word token: characters that cannot start a split, a letter that
+# can only start one at a word boundary, or any other character that doesn't
+_WORD_CHAR = rf"""
+    (?:[^\s;@#$%&?!()\[\]{{}}<>"`:,.'cglnw-]++ | \B[cglw] | n(?!'t)
+    | (?!{_PUNCT}|{_FINAL_PERIOD}|{_SUFFIX}|{_CONTRACTION})\S)
+"""
+
+# one pass equivalent of TreebankWordTokenizer on lowercased text. Words
+# starting with a letter no other branch starts with take the first branch
+TOKEN_RE = re.compile(
+    rf"""
+    \s*(
+    [^\s;@#$%&?!()\[\]{{}}<>"`:,.'cglimntw-]{_WORD_CHAR}*
+    | {_PUNCT} | {_FINAL_PERIOD}
+    | {_CONTRACTION}
+    | n(?<=\bcann)ot(?:\b|(?={_SUFFIX})) | n(?<=\bgonn)a(?:\b|(?={_SUFFIX}))
+    | t(?<=\bgott)a(?:\b|(?={_SUFFIX})) | m(?<=\b[gl]imm)e(?:\b|(?={_SUFFIX}))
+    | n(?<=\bwann)a(?={_BREAK})
+    | '(?:(?<=[\ ;@#$%&?!()\[\]{{}}<>":,]')|(?<=--')|(?<=\.\.\.')|(?<=\A'))t(?=(?:is|was)\b)
+    | i(?<='ti)s\b | w(?<='tw)as\b
+    | {_SUFFIX}
+    | {_WORD_CHAR}+
+    )
+    """,
+    re.VERBOSE,
+)
 
 
 class Sentimenter:
     """
     Creates object to handle dictionary-lookup sentiment scoring
+
+    Args:
+        fast (bool): True to tokenize with TOKEN_RE, a single regex that
+            splits text the way the Treebank tokenizer does, and look words
+            up in one word to polarity table. Default False
     """
 
-    def __init__(self):
-        self.pos = set(opinion_lexicon.positive())
-        self.neg = set(opinion_lexicon.negative())
-        self.tok = treebank.TreebankWordTokenizer()
+    def __init__(self, fast=False):
+        self.pos, self.neg = load_lexicon()
+        self.fast = fast
+
+        # positive wins for words in both lists, as in sentiment
+        self.polarity = dict.fromkeys(self.neg, -1)
+        self.polarity.update(dict.fromkeys(self.pos, 1))
+
+    @cached_property
+    def tok(self):
+        """
+        The Treebank tokenizer, imported on first use since importing NLTK
+        takes seconds.
+        """
+        from nltk.tokenize import treebank
+
+        return treebank.TreebankWordTokenizer()
+
+    @cached_property
+    def vocabulary(self):
+        """
+        Lexicon word to its column in document-term matrices, which have
+        one more column for all other words.
+        """
+        return {word: i for i, word in enumerate(sorted(self.polarity))}
+
+    @cached_property
+    def weights(self):
+        """
+        Sparse matrix from document-term matrix columns to pos, neg and
+        wordcount columns.
+        """
+        from scipy import sparse
+
+        polarity = np.array([self.polarity[word] for word in self.vocabulary] + [0])
+        return sparse.csr_matrix(
+            np.column_stack(
+                [polarity == 1, polarity == -1, np.ones(len(polarity), dtype=bool)]
+            ).astype(np.int64)
+        )
 
     def sentiment(self, text):
         """
@@ -26,6 +119,8 @@ class Sentimenter:
         Returns (dict): (sentiment score, positive wordcount, 
             negative wordcount, and total wordcount)
         """
+        if self.fast:
+            return self.sentiment_fast(text)
         pcount = ncount = 0
         words = [word.lower() for word in self.tok.tokenize(text)]
         for word in words:
@@ -40,6 +135,226 @@ class Sentimenter:
             "wordcount": len(words),
         }
 
+    def sentiment_fast(self, text):
+        """
+        Returns the dictionary sentiment of a text like sentiment, but
+        tokenized in one pass of TOKEN_RE and scored per distinct word.
+
+        Args:
+            text (str): text to get a sentiment score from
+
+        Returns (dict): (sentiment score, positive wordcount,
+            negative wordcount, and total wordcount)
+        """
+        words = TOKEN_RE.findall(text.lower())
+        pcount = ncount = 0
+        polarity = self.polarity
+        for word, n in Counter(words).items():
+            p = polarity.get(word)
+            if p == 1:
+                pcount += n
+            elif p == -1:
+                ncount += n
+        return {
+            "sentiment": (pcount - ncount) / (pcount + ncount + 1),
+            "pos": pcount,
+            "neg": ncount,
+            "wordcount": len(words),
+        }
+
+    def document_term_matrix(self, texts):
+        """
+        Counts the lexicon words of each text, tokenized like sentiment_fast.
+        All other words are counted in the last column.
+
+        Args:
+            texts (list of str): texts to count the words of
+
+        Returns: (scipy sparse csr_matrix) texts by len(vocabulary) + 1
+            word counts.
+        """
+        from scipy import sparse
+
+        vocabulary = self.vocabulary
+        other = len(vocabulary)
+        indices = array("l")
+        indptr = array("l", [0])
+        for text in texts:
+            words = TOKEN_RE.findall(text.lower())
+            indices.extend(map(vocabulary.get, words, repeat(other)))
+            indptr.append(len(indices))
+        matrix = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.int64), indices, indptr),
+            shape=(len(texts), other + 1),
+        )
+        matrix.sum_duplicates()
+        return matrix
+
+    def sentiment_batch(self, texts):
+        """
+        Returns the dictionary sentiment of many texts at once: their
+        document-term matrix is multiplied by weights to get the pos, neg and
+        wordcount columns, and the scores are computed from those columns.
+        Gives the same results as sentiment_fast.
+
+        Args:
+            texts (list of str): texts to get sentiment scores from
+
+        Returns: (list of dicts) the scores of each text, as in sentiment.
+        """
+        counts = (self.document_term_matrix(texts) @ self.weights).toarray()
+        pos, neg, wordcount = counts.T
+        scores = (pos - neg) / (pos + neg + 1)
+        return [
+            {"sentiment": score, "pos": p, "neg": n, "wordcount": w}
+            for score, p, n, w in zip(
+                scores.tolist(), pos.tolist(), neg.tolist(), wordcount.tolist()
+            )
+        ]
+
+
+@lru_cache(maxsize=None)
+def load_lexicon(path=LEXICON_PATH):
+    """
+    Loads the opinion lexicon, once per process, from the pickle made by
+    build_lexicon, building it first if it doesn't exist yet.
+
+    Args:
+        path (str): pickle file. Default LEXICON_PATH
+
+    Returns: (frozenset, frozenset) the positive and negative words.
+    """
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return build_lexicon(path)
+
+
+def build_lexicon(path=LEXICON_PATH, download=True):
+    """
+    Precompiles NLTK's opinion lexicon into a pickle of two frozensets,
+    which load_lexicon reads in milliseconds instead of importing NLTK.
+
+    Args:
+        path (str): pickle file to write. Default LEXICON_PATH
+        download (bool): True to download the corpus if NLTK doesn't have
+            it. Default True
+
+    Returns: (frozenset, frozenset) the positive and negative words.
+    """
+    import nltk
+    from nltk.corpus import opinion_lexicon
+
+    try:
+        opinion_lexicon.ensure_loaded()
+    except LookupError:
+        if not download:
+            raise
+        nltk.download("opinion_lexicon")
+    lexicon = frozenset(opinion_lexicon.positive()), frozenset(
+        opinion_lexicon.negative()
+    )
+
+    # written to a temporary file first, as worker processes may race here
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}"
+    with open(tmp, "wb") as f:
+        pickle.dump(lexicon, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    return lexicon
+
+
+def lyrics_hash(lyrics):
+    """
+    Hashes a lyrics text, so identical lyrics saved under several tracks
+    can share one score.
+
+    Args:
+        lyrics (str): the lyrics
+
+    Returns: (str) hex digest of the text.
+    """
+    return hashlib.blake2b(lyrics.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ScoreCache:
+    """
+    Cache of sentiment scores by lyrics_hash, so lyrics shared by several
+    tracks, e.g. the clean and explicit versions of a song, are scored once.
+    Scores come from earlier chunks of the same run or from documents
+    already scored in the lyrics collection.
+
+    Args:
+        collection (pymongo Collection): lyrics collection to look up
+            scored documents in. Default None, only this run's scores.
+    """
+
+    def __init__(self, collection=None):
+        self.collection = collection
+        self.scores = dict()
+        self.hits = 0
+        self.misses = 0
+
+    def plan(self, chunk):
+        """
+        Hashes a chunk of lyrics and picks out the texts that still need
+        scoring. Texts already scored, or picked from an earlier chunk, are
+        hits.
+
+        Args:
+            chunk (list of tuples): (_id, lyrics) pairs
+
+        Returns: (list, list) the (_id, hash) pairs of the chunk, and the
+            (hash, lyrics) pairs of its distinct texts to score.
+        """
+        keys = [(_id, lyrics_hash(lyrics)) for _id, lyrics in chunk]
+        new = {
+            key: lyrics
+            for (_, key), (_, lyrics) in zip(keys, chunk)
+            if key not in self.scores
+        }
+        if new and self.collection is not None:
+            query = {
+                "lyrics_hash": {"$in": list(new)},
+                "dict_sentiment": {"$exists": True},
+            }
+            projection = {"lyrics_hash": 1, "dict_sentiment": 1}
+            for doc in self.collection.find(query, projection):
+                self.scores[doc["lyrics_hash"]] = doc["dict_sentiment"]
+                new.pop(doc["lyrics_hash"], None)
+
+        # scored by a worker before the chunk's results are resolved
+        self.scores.update(dict.fromkeys(new))
+        self.misses += len(new)
+        self.hits += len(keys) - len(new)
+        return keys, list(new.items())
+
+    def resolve(self, keys, scored):
+        """
+        Records the scores of a planned chunk's new texts.
+
+        Args:
+            keys (list of tuples): (_id, hash) pairs from plan
+            scored (list of tuples): (hash, scores) pairs of the new texts
+
+        Returns: (list of tuples) (_id, hash, scores) for the whole chunk.
+        """
+        self.scores.update(scored)
+        return [(_id, key, self.scores[key]) for _id, key in keys]
+
+    def report(self):
+        """
+        Describes how many scorings the cache saved.
+
+        Args: None
+
+        Returns: (str) one-line summary.
+        """
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0.0
+        return f"score cache: {self.hits}/{lookups} hits ({rate:.0%})"
+
 
 def process_mongo_docs(verbose=1):
     """
@@ -51,28 +366,155 @@ def process_mongo_docs(verbose=1):
 
     Returns: None. Sets sentiment fields in lyrics data.
     """
+    score_lyrics(verbose=verbose)
 
-    # initialize db collection
-    collection = MongoClient().billboard.lyrics
 
-    # gets documents from lyrics collection
-    results = collection.find(
-        {"$and": [{"_id": {"$exists": "true"}}, {"lyrics": {"$exists": "true"}}]}
-    )
+def score_lyrics(
+    collection=None,
+    rescore=False,
+    processes=None,
+    chunk_size=500,
+    fast=False,
+    batch=False,
+    verbose=1,
+):
+    """
+    Scores lyrics documents on a pool of processes and writes the scores
+    back in bulk. Only the _id and lyrics of each document are fetched, in
+    chunks of chunk_size that are scored in parallel, a few chunks at a time
+    so the cursor is never read far ahead of the workers. Lyrics identical
+    to ones already scored reuse their scores through a ScoreCache, and the
+    lyrics_hash is saved with the scores.
+
+    Args:
+        collection (pymongo Collection): lyrics collection. Default None,
+            billboard.lyrics on the local MongoDB.
+        rescore (bool): True to score every document again, e.g. after a
+            lexicon change, rather than only the unscored ones. Default False
+        processes (int): worker processes, or 1 to score in this process.
+            Default None, one per CPU.
+        chunk_size (int): documents per chunk and per bulk write. Default 500
+        fast (bool): True to score with Sentimenter's fast path. Default False
+        batch (bool): True to score each chunk at once with sentiment_batch,
+            which tokenizes like the fast path. Default False
+        verbose (int): 1 prints progress, 0 prints nothing. Default 1
+
+    Returns: (int, float) documents scored and documents per second.
+    """
+    if collection is None:
+        collection = MongoClient().billboard.lyrics
+    query = {"lyrics": {"$exists": True}}
+    if not rescore:
+        query["dict_sentiment"] = {"$exists": False}
+    cursor = collection.find(query, {"lyrics": 1}, batch_size=chunk_size)
+    chunks = _chunks(((doc["_id"], doc["lyrics"]) for doc in cursor), chunk_size)
+
+    # old scores are only reused when not rescoring
+    collection.create_index("lyrics_hash")
+    cache = ScoreCache(None if rescore else collection)
+    planned = deque()
 
-    s = Sentimenter()
-    count = 0
-    for track in results:
+    def new_texts():
+        for chunk in chunks:
+            keys, new = cache.plan(chunk)
+            planned.append(keys)
+            yield new
 
-        # do nothing if a sentiment field already exists
-        if track.get("dict_sentiment") == None:
-            scores = s.sentiment(track["lyrics"])
-            collection.update(
-                {"_id": track["_id"]}, {"$set": {"dict_sentiment": scores}}
+    def write(scored):
+        count = 0
+        for new_scores in scored:
+            results = cache.resolve(planned.popleft(), new_scores)
+            collection.bulk_write(
+                [
+                    UpdateOne(
+                        {"_id": _id},
+                        {
+                            "$set": {"dict_sentiment": scores, "lyrics_hash": key},
+                            # stamped with the server's time as it is written
+                            "$currentDate": {"scored": True},
+                        },
+                    )
+                    for _id, key, scores in results
+                ],
+                ordered=False,
             )
-            count += 1
+            count += len(results)
             if verbose:
-                print(count)
+                rate = count / (time.perf_counter() - start)
+                print(f"{count} scored, {rate:.0f} docs/s")
+        return count
+
+    start = time.perf_counter()
+    if processes == 1:
+        _init_worker(fast, batch)
+        count = write(map(_score_chunk, new_texts()))
+    else:
+        processes = processes or os.cpu_count()
+        with ProcessPoolExecutor(
+            processes, initializer=_init_worker, initargs=(fast, batch)
+        ) as pool:
+            count = write(_bounded_map(pool, _score_chunk, new_texts(), 2 * processes))
+
+    rate = count / (time.perf_counter() - start)
+    if verbose:
+        print(f"Scored {count} documents at {rate:.0f} docs/s")
+        print(cache.report())
+    return count, rate
+
+
+def _chunks(iterable, size):
+    """
+    Groups an iterable into lists of up to size items.
+    """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _bounded_map(pool, f, iterable, window):
+    """
+    Like pool.map, but submits at most window calls ahead of the results
+    taken, in order.
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.submit(f, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+# Sentimenter of a scoring worker process and whether it scores whole
+# chunks with sentiment_batch, set by _init_worker
+_sentimenter = None
+_batch = False
+
+
+def _init_worker(fast=False, batch=False):
+    """
+    Makes the Sentimenter a scoring worker process uses.
+    """
+    global _sentimenter, _batch
+    _sentimenter = Sentimenter(fast)
+    _batch = batch
+
+
+def _score_chunk(chunk):
+    """
+    Scores a chunk of (key, lyrics) pairs in a worker process.
+
+    Returns: list of (key, scores) pairs.
+    """
+    if _batch and chunk:
+        ids, lyrics = zip(*chunk)
+        return list(zip(ids, _sentimenter.sentiment_batch(lyrics)))
+    return [(_id, _sentimenter.sentiment(lyrics)) for _id, lyrics in chunk]
 
 
 if __name__ == "__main__":
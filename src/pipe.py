@@ -1,12 +1,554 @@
 import pandas as pd
 import numpy as np
 from pymongo import MongoClient
-from functools import reduce
-from operator import add
+from bson import ObjectId
 from collections import defaultdict, Counter
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+import glob, hashlib, os, time
+from datetime import timedelta
 
 from sklearn.model_selection import train_test_split
 
+# Field schemas shared by the BillboardData.load_* methods. Each entry is
+# (column name, path into the Mongo document, numpy dtype or "category").
+# Integer path elements index into arrays; a path of None fills the column
+# with None. The dtypes are the narrowest that hold the Spotify API ranges.
+# Fields merged onto the tracks are floats, so tracks without a match can
+# hold NaN without upcasting to float64.
+SPOTIFY_SCHEMA = (
+    ("artist", ("metadata", "artists", 0, "name"), object),
+    ("album_id", ("metadata", "album", "id"), object),
+    ("album_type", ("metadata", "album", "album_type"), "category"),
+    ("total_tracks", ("metadata", "album", "total_tracks"), np.int16),
+    ("release_date", ("metadata", "album", "release_date"), object),
+    (
+        "release_date_precision",
+        ("metadata", "album", "release_date_precision"),
+        "category",
+    ),
+    ("disc_number", ("metadata", "disc_number"), np.int16),
+    ("duration_ms", ("metadata", "duration_ms"), np.int32),
+    ("explicit", ("metadata", "explicit"), bool),
+    ("track_id", ("metadata", "id"), object),
+    ("title", ("metadata", "name"), object),
+    ("popularity", ("metadata", "popularity"), np.int8),
+    ("track_number", ("metadata", "track_number"), np.int16),
+    ("danceability", ("audio_features", "danceability"), np.float32),
+    ("energy", ("audio_features", "energy"), np.float32),
+    ("acousticness", ("audio_features", "acousticness"), np.float32),
+    ("key", ("audio_features", "key"), np.int8),
+    ("loudness", ("audio_features", "loudness"), np.float32),
+    ("mode", ("audio_features", "mode"), np.int8),
+    ("speechiness", ("audio_features", "speechiness"), np.float32),
+    ("instrumentalness", ("audio_features", "instrumentalness"), np.float32),
+    ("liveness", ("audio_features", "liveness"), np.float32),
+    ("valence", ("audio_features", "valence"), np.float32),
+    ("tempo", ("audio_features", "tempo"), np.float32),
+    ("time_signature", ("audio_features", "time_signature"), np.int8),
+    ("obj_id", ("_id",), object),
+)
+
+# no obj_id because these tracks were not on the billboard.
+NILLBOARD_SCHEMA = SPOTIFY_SCHEMA[:-1] + (("obj_id", None, object),)
+
+LYRICS_SCHEMA = (
+    ("track_id", ("_id",), object),
+    ("response_artist", ("response_artist",), object),
+    ("response_title", ("response_title",), object),
+    ("poscount", ("dict_sentiment", "pos"), np.float32),
+    ("negcount", ("dict_sentiment", "neg"), np.float32),
+    ("wordcount", ("dict_sentiment", "wordcount"), np.float32),
+)
+
+HOT100_SCHEMA = (
+    ("obj_id", ("_id",), object),
+    ("bb_artist", ("artist",), object),
+    ("bb_title", ("title",), object),
+    ("date_entered_bb", ("date",), object),
+    ("peakPos", ("peakPos",), np.float32),
+    ("weeks", ("weeks",), np.float32),
+)
+
+ALBUM_SCHEMA = (
+    ("album_id", ("_id",), object),
+    ("label", ("label",), "category"),
+    ("album_popularity", ("popularity",), np.float32),
+)
+
+# only lyrics that have been scored are loaded
+LYRICS_QUERY = {"dict_sentiment.wordcount": {"$exists": "true"}}
+
+# collections read by BillboardData.load, with the filter each is read with
+LOAD_COLLECTIONS = (
+    ("spotify", None),
+    ("spotify_nillboard", None),
+    ("spotify_albums", None),
+    ("hot100filtered", None),
+    ("lyrics", LYRICS_QUERY),
+)
+
+# field the server stamps, with $currentDate, when a document is first written
+# or, for lyrics, scored. The newest stamp is the high-water mark
+# BillboardData.refresh reads from. Stamps come from each mongod's clock and
+# unordered bulk writes commit in no set order, so a document can become
+# visible after the mark was taken yet carry an older stamp; refresh rereads
+# WATERMARK_OVERLAP before each mark to pick those up.
+CHANGE_FIELDS = {
+    "spotify": "scraped",
+    "spotify_nillboard": "scraped",
+    "spotify_albums": "scraped",
+    "hot100filtered": "scraped",
+    "lyrics": "scored",
+}
+
+# how far before a high-water mark refresh starts reading. Rereading a
+# document only replaces its row with the same values.
+WATERMARK_OVERLAP = timedelta(minutes=10)
+
+
+def schema_projection(schema):
+    """
+    Builds the Mongo projection that returns only the fields in a schema.
+
+    Args:
+        schema (tuple): field schema, e.g. SPOTIFY_SCHEMA
+
+    Returns: (dict) projection for collection.find
+    """
+    projection = {
+        ".".join(key for key in path if isinstance(key, str)): 1
+        for _, path, _ in schema
+        if path
+    }
+    projection.setdefault("_id", 0)
+    return projection
+
+
+def _get_path(doc, path):
+    """
+    Follows a schema path into a document.
+
+    Args:
+        doc (dict): Mongo document
+        path (tuple): keys and array indices to follow
+
+    Returns: the value at the end of the path.
+    """
+    for key in path:
+        doc = doc[key]
+    return doc
+
+
+def load_collection(collection, schema, query=None, batch_size=10000):
+    """
+    Loads the fields of a schema from a Mongo collection into a dataframe.
+    Only the schema fields are requested from the server.
+
+    Args:
+        collection (pymongo Collection): collection to read from
+        schema (tuple): field schema, e.g. SPOTIFY_SCHEMA
+        query (dict): filter for the find. Default None, all documents.
+        batch_size (int): documents decoded per batch. Default 10000
+
+    Returns: Dataframe with one column per schema field.
+    """
+    cursor = collection.find(
+        query or {}, schema_projection(schema), batch_size=batch_size
+    )
+    return decode_cursor(cursor, schema, batch_size)
+
+
+def load_ids(collection, schema, ids, query=None, batch_size=50000):
+    """
+    Loads the documents of a Mongo collection whose _id is in ids. The ids
+    are sent batch_size at a time, so no query comes near the 16 MB BSON
+    document limit however many ids there are.
+
+    Args:
+        collection (pymongo Collection): collection to read from
+        schema (tuple): field schema, e.g. SPOTIFY_SCHEMA
+        ids (iterable): _id values to load
+        query (dict): extra filter for the documents. Default None
+        batch_size (int): ids per query. Default 50000
+
+    Returns: Dataframe with one column per schema field.
+    """
+    ids = list(ids)
+    frames = []
+    for start in range(0, len(ids), batch_size):
+        batch = {"_id": {"$in": ids[start : start + batch_size]}}
+        frames.append(
+            load_collection(
+                collection, schema, {"$and": [query, batch]} if query else batch
+            )
+        )
+    if not frames:
+        frames.append(load_collection(collection, schema, {"_id": {"$in": []}}))
+    return concat_frames(frames)
+
+
+def decode_cursor(cursor, schema, batch_size=10000):
+    """
+    Decodes the documents of a cursor into a dataframe. Each batch is decoded
+    straight into one typed array per column, so the dataframe is built once
+    from whole columns.
+
+    Args:
+        cursor (iterable of dict): documents, e.g. a pymongo Cursor
+        schema (tuple): field schema, e.g. SPOTIFY_SCHEMA
+        batch_size (int): documents decoded per batch. Default 10000
+
+    Returns: Dataframe with one column per schema field.
+    """
+    chunks = {name: [] for name, _, _ in schema}
+    cursor = iter(cursor)
+    while True:
+        batch = list(islice(cursor, batch_size))
+        if not batch:
+            break
+        for name, path, dtype in schema:
+            if path is None:
+                values = [None] * len(batch)
+            else:
+                values = [_get_path(doc, path) for doc in batch]
+            chunks[name].append(np.array(values, dtype=_array_dtype(dtype)))
+
+    columns = {}
+    for name, _, dtype in schema:
+        if chunks[name]:
+            column = np.concatenate(chunks[name])
+        else:
+            column = np.empty(0, _array_dtype(dtype))
+        columns[name] = pd.Categorical(column) if dtype == "category" else column
+    return pd.DataFrame(columns, columns=[name for name, _, _ in schema])
+
+
+def _array_dtype(dtype):
+    """
+    The numpy dtype a schema column is decoded into.
+
+    Args:
+        dtype: numpy dtype or "category" from a schema entry
+
+    Returns: numpy dtype, with categories decoded as objects.
+    """
+    return object if dtype == "category" else dtype
+
+
+def db_fingerprint(db):
+    """
+    Summarizes the state of the collections BillboardData.load reads: the
+    number of documents each load query matches plus the newest _id and
+    newest change stamp (see CHANGE_FIELDS) in each collection.
+
+    Args:
+        db (pymongo Database): the billboard database
+
+    Returns: (str) hex digest that changes when any of the collections do.
+    """
+    marks = change_watermarks(db)
+    state = []
+    for name, query in LOAD_COLLECTIONS:
+        collection = db[name]
+        newest_id = collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        state.append(
+            (
+                name,
+                collection.count_documents(query or {}),
+                newest_id and newest_id["_id"],
+                marks[name],
+            )
+        )
+    return hashlib.sha1(repr(state).encode()).hexdigest()[:16]
+
+
+def create_change_indexes(db):
+    """
+    Indexes the change stamp of each collection BillboardData.load reads, so
+    BillboardData.refresh reads only what changed. Run once at setup; it
+    needs write access.
+
+    Args:
+        db (pymongo Database): the billboard database
+
+    Returns: None
+    """
+    for name, field in CHANGE_FIELDS.items():
+        db[name].create_index(field)
+
+
+def change_watermarks(db):
+    """
+    Finds the newest change stamp in each collection BillboardData.load reads.
+    The stamps are the server's write times (see CHANGE_FIELDS).
+
+    Args:
+        db (pymongo Database): the billboard database
+
+    Returns: (dict) collection name to its newest stamp, or None if no
+    document in it has been stamped.
+    """
+    marks = {}
+    for name, field in CHANGE_FIELDS.items():
+        newest = db[name].find_one(
+            {field: {"$exists": True}}, {field: 1}, sort=[(field, -1)]
+        )
+        marks[name] = newest and newest[field]
+    return marks
+
+
+def concat_frames(frames):
+    """
+    Concatenates frames, unioning the categories of categorical columns so
+    they stay categorical.
+
+    Args:
+        frames (list of Pandas DataFrame): frames with the same columns
+
+    Returns: Pandas DataFrame
+    """
+    frames = [df for df in frames if len(df)] or frames[:1]
+    for col in frames[0].columns:
+        if all(isinstance(df[col].dtype, pd.CategoricalDtype) for df in frames):
+            categories = frames[0][col].cat.categories
+            for df in frames[1:]:
+                categories = categories.union(df[col].cat.categories)
+            frames = [
+                df.assign(**{col: df[col].cat.set_categories(categories)})
+                for df in frames
+            ]
+    return pd.concat(frames, ignore_index=True, sort=False)
+
+
+def merge_tracks(tracks, lyrics, albums, hot100):
+    """
+    Left-joins lyrics, album and Hot 100 data onto Spotify tracks.
+
+    Args:
+        tracks (Pandas DataFrame): SPOTIFY_SCHEMA columns
+        lyrics (Pandas DataFrame): LYRICS_SCHEMA columns
+        albums (Pandas DataFrame): ALBUM_SCHEMA columns
+        hot100 (Pandas DataFrame): HOT100_SCHEMA columns
+
+    Returns: Pandas DataFrame with one row per track.
+    """
+    return (
+        tracks.merge(right=lyrics, how="left", on="track_id")
+        .merge(right=albums, how="left", on="album_id")
+        .merge(right=hot100, how="left", on="obj_id")
+    )
+
+
+def write_snapshot(df, path):
+    """
+    Writes a dataframe to an uncompressed Arrow (Feather) file so it can
+    later be memory-mapped. obj_id holds bson ObjectIds, which Arrow cannot
+    store, so it is written as strings and flagged in the file metadata for
+    read_snapshot to convert back.
+
+    Args:
+        df (Pandas DataFrame): the frame to save
+        path (str): file to write, replaced atomically
+
+    Returns: None
+    """
+    import pyarrow as pa
+    from pyarrow import feather
+
+    df = df.copy()
+    metadata = {}
+    if "obj_id" in df.columns:
+        if df.obj_id.map(lambda v: isinstance(v, ObjectId)).any():
+            metadata[b"obj_id"] = b"ObjectId"
+        df["obj_id"] = df.obj_id.where(df.obj_id.isna(), df.obj_id.astype(str))
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**table.schema.metadata, **metadata})
+    tmp_path = path + ".tmp"
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path, columns=None):
+    """
+    Reads a snapshot written by write_snapshot through a memory map, so only
+    the requested columns are paged in.
+
+    Args:
+        path (str): snapshot file
+        columns (list of str): columns to read. Default None, all columns.
+
+    Returns: Pandas DataFrame
+    """
+    from pyarrow import feather
+
+    table = feather.read_table(path, columns=columns, memory_map=True)
+    df = table.to_pandas()
+    if "obj_id" in df.columns and table.schema.metadata.get(b"obj_id") == b"ObjectId":
+        df["obj_id"] = df.obj_id.map(
+            lambda v: ObjectId(v) if isinstance(v, str) else None
+        ).astype(object)
+    return df
+
+
+def release_parts(release_date, precision, missing_month=np.nan):
+    """
+    Breaks Spotify release dates out into year and month. Dates come as
+    'YYYY', 'YYYY-MM' or 'YYYY-MM-DD' depending on their precision.
+
+    Args:
+        release_date (Pandas Series of str): release dates
+        precision (Pandas Series of str): 'year', 'month' or 'day' per date
+        missing_month (float): month given to dates whose precision is not
+            'day'. Default NaN
+
+    Returns: (Pandas Series, Pandas Series) the integer year and the month,
+    which is missing_month unless the precision is 'day'.
+    """
+    year = release_date.str[:4].astype(np.int16)
+    month = pd.to_numeric(release_date.str[5:7], errors="coerce").where(
+        precision == "day", missing_month
+    )
+    return year, month.astype(np.float32)
+
+
+def balanced_year_sample(release_year, on_billboard, ratio=1.0, rng=None):
+    """
+    Stratified undersampling of Nillboard tracks: for every release year,
+    picks ratio times as many Nillboard tracks as there are Billboard tracks
+    (or all of them, if there are fewer). Works on whatever years are present.
+
+    Args:
+        release_year (array-like of int): release year of each track
+        on_billboard (array-like of bool): target of each track
+        ratio (float): Nillboard tracks per Billboard track. Default 1.0
+        rng (numpy Generator): source of randomness. Default None, a fresh
+            unseeded Generator.
+
+    Returns: (numpy ndarray) sorted positions of every Billboard track and
+    the sampled Nillboard tracks.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    years = np.asarray(release_year)
+    hits = np.asarray(on_billboard, dtype=bool)
+
+    # Nillboard positions sorted by year, in random order within a year
+    nillboard = np.flatnonzero(~hits)
+    order = nillboard[np.lexsort((rng.random(nillboard.size), years[nillboard]))]
+    order_years = years[order]
+
+    # rank of each Nillboard track within its year
+    _, starts, sizes = np.unique(order_years, return_index=True, return_counts=True)
+    rank = np.arange(order.size) - np.repeat(starts, sizes)
+
+    # number of Nillboard tracks wanted in each track's year
+    hit_years, hit_counts = np.unique(years[hits], return_counts=True)
+    quota = np.zeros(order.size)
+    if hit_years.size:
+        slot = np.minimum(np.searchsorted(hit_years, order_years), hit_years.size - 1)
+        matched = hit_years[slot] == order_years
+        quota[matched] = np.round(ratio * hit_counts[slot[matched]])
+
+    return np.sort(np.concatenate([np.flatnonzero(hits), order[rank < quota]]))
+
+
+def _timed(f):
+    """
+    Calls a function and times it.
+
+    Args:
+        f (function): function of no arguments
+
+    Returns: (object, float) the result of f and the seconds it took.
+    """
+    start = time.perf_counter()
+    result = f()
+    return result, time.perf_counter() - start
+
+
+class LabelHitcountEncoder:
+    """
+    Encodes record label names as the number of Billboard hits their labels
+    had in the data it was fit on. A label field may name several labels
+    separated by '/'; each one gets credit for the hit, and a track gets the
+    truncated mean of its labels' hit counts.
+
+    Args:
+        handle_unknown (str): what to do with labels not seen in fit.
+            'zero' counts them as 0 hits, 'ignore' leaves them out of the
+            mean (0 if a track has no known labels), 'error' raises a
+            ValueError. Default 'zero'
+    """
+
+    def __init__(self, handle_unknown="zero"):
+        if handle_unknown not in ("zero", "ignore", "error"):
+            raise ValueError(f"Unknown handle_unknown: {handle_unknown}")
+        self.handle_unknown = handle_unknown
+
+    @staticmethod
+    def split_labels(labels):
+        """
+        Splits label fields into one normalized (lowercase, no whitespace)
+        label name per row.
+
+        Args:
+            labels (Pandas Series of str): label fields
+
+        Returns: (Pandas Series) label names, indexed by the position of the
+        field they came from.
+        """
+        labels = pd.Series(np.asarray(labels, dtype=object)).fillna("")
+        return (
+            labels.str.split("/")
+            .explode()
+            .str.replace(r"\s+", "", regex=True)
+            .str.lower()
+        )
+
+    def fit(self, labels, on_billboard):
+        """
+        Counts the hits of each label.
+
+        Args:
+            labels (Pandas Series of str): label fields
+            on_billboard (Pandas Series of bool): target for each field
+
+        Returns: self
+        """
+        names = self.split_labels(labels[np.asarray(on_billboard == 1)])
+        self.hitcounts_ = names.groupby(names).size()
+        return self
+
+    def transform(self, labels):
+        """
+        Maps label fields to hit counts.
+
+        Args:
+            labels (Pandas Series of str): label fields
+
+        Returns: (Pandas Series of int) hit counts, with the index of labels.
+        """
+        counts = self.split_labels(labels).map(self.hitcounts_)
+        if counts.isna().any():
+            if self.handle_unknown == "error":
+                raise ValueError("Labels not seen in fit encountered")
+            elif self.handle_unknown == "zero":
+                counts = counts.fillna(0)
+        hitcounts = counts.groupby(level=0).mean().fillna(0).astype(int)
+        return pd.Series(hitcounts.values, index=labels.index, name=labels.name)
+
+    def fit_transform(self, labels, on_billboard):
+        """
+        Fits to label fields and maps them to hit counts.
+
+        Args:
+            labels (Pandas Series of str): label fields
+            on_billboard (Pandas Series of bool): target for each field
+
+        Returns: (Pandas Series of int) hit counts, with the index of labels.
+        """
+        return self.fit(labels, on_billboard).transform(labels)
+
 
 class BillboardData:
     """
@@ -17,28 +559,202 @@ class BillboardData:
     bbd.transform...()
     """
 
-    def __init__(self):
-        self.db = MongoClient().billboard
+    def __init__(self, db=None):
+        self.db = db if db is not None else MongoClient().billboard
         self.df = None
 
-    def load(self):
+    def load(self, cache_dir=None, columns=None, workers=1, verbose=0):
         """
         Loads Spotify, Genius, and Billboard data from a local MongoDB into self.df.
+
+        Args:
+            cache_dir (str): directory for an on-disk snapshot of the merged
+                frame. The snapshot is reused while the database is unchanged
+                and rebuilt otherwise. Default None, no snapshot.
+            columns (list of str): columns to keep. Only these are read from
+                a snapshot. Default None, all columns.
+            workers (int): threads loading the collections at the same time, up to one per collection. The time
+                each collection took is saved in self.load_times. Default 1
+            verbose (int): 1 to print the time each collection took.
+                Default 0
         """
-        # loads all
-        df1 = self.load_spotify_billboard_data()
-        df2 = self.load_spotify_nillboard_data()
-        adf = self.load_spotify_album_data()
-        bbdf = self.load_hot_100_data()
-        lyrics_df = self.load_lyrics_data()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            path = os.path.join(
+                cache_dir, f"billboard-{db_fingerprint(self.db)}.feather"
+            )
+            if not os.path.exists(path):
+                self.load(workers=workers, verbose=verbose)
+                self.save_snapshot(cache_dir, path)
+            self.df = read_snapshot(path, columns)
+            self.watermarks = change_watermarks(self.db)
+            return
+
+        self.watermarks = change_watermarks(self.db)
+
+        # loads all, concurrently if there is more than one worker
+        loaders = {
+            "spotify": self.load_spotify_billboard_data,
+            "spotify_nillboard": self.load_spotify_nillboard_data,
+            "spotify_albums": self.load_spotify_album_data,
+            "hot100filtered": self.load_hot_100_data,
+            "lyrics": self.load_lyrics_data,
+        }
+        with ThreadPoolExecutor(max_workers=min(workers, len(loaders))) as pool:
+            futures = {
+                name: pool.submit(_timed, loader) for name, loader in loaders.items()
+            }
+        frames, self.load_times = {}, {}
+        for name, future in futures.items():
+            frames[name], self.load_times[name] = future.result()
+            if verbose:
+                print(f"{name}: {self.load_times[name]:.2f}s")
 
         # combines all the dataframes
-        self.df = (
-            df1.append(df2, ignore_index=True, sort=False)
-            .merge(right=lyrics_df, how="left", on="track_id")
-            .merge(right=adf, how="left", on="album_id")
-            .merge(right=bbdf, how="left", on="obj_id")
+        self.df = merge_tracks(
+            concat_frames([frames["spotify"], frames["spotify_nillboard"]]),
+            frames["lyrics"],
+            frames["spotify_albums"],
+            frames["hot100filtered"],
+        )
+        if columns:
+            self.df = self.df[columns]
+
+    def save_snapshot(self, cache_dir, path=None):
+        """
+        Saves self.df as the snapshot for the current database state,
+        removing older snapshots.
+
+        Args:
+            cache_dir (str): snapshot directory
+            path (str): snapshot file. Default None, named after the
+                current db_fingerprint.
+
+        Returns: None
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        path = path or os.path.join(
+            cache_dir, f"billboard-{db_fingerprint(self.db)}.feather"
+        )
+        for stale in glob.glob(os.path.join(cache_dir, "billboard-*.feather")):
+            os.remove(stale)
+        write_snapshot(self.df, path)
+
+    def refresh(self, cache_dir=None):
+        """
+        Brings self.df up to date with documents added or changed since the
+        last load or refresh, without reloading everything. New and changed
+        tracks are loaded with their lyrics, album and Hot 100 data and
+        replace or extend their rows; changed lyrics, albums and Hot 100
+        entries overwrite the rows they join to. Only documents stamped at
+        or after the high-water mark of their collection (see CHANGE_FIELDS)
+        are read, less WATERMARK_OVERLAP, so the time taken follows the
+        size of the change once create_change_indexes has been run. Needs
+        the untransformed frame from load.
+
+        Args:
+            cache_dir (str): snapshot directory to save the refreshed frame
+                to. Default None, nothing is saved.
+
+        Returns: (dict) number of changed documents read per collection.
+        """
+        if "track_id" not in self.df.columns:
+            raise ValueError("refresh needs the frame from load, not a transformed one")
+
+        # read only what changed since the high-water marks
+        marks = change_watermarks(self.db)
+        changed = {}
+        for name, query in LOAD_COLLECTIONS:
+            field = CHANGE_FIELDS[name]
+            if self.watermarks[name] is None:
+                since = {field: {"$exists": True}}
+            else:
+                since = {field: {"$gte": self.watermarks[name] - WATERMARK_OVERLAP}}
+            changed[name] = {"$and": [query, since]} if query else since
+        tracks = concat_frames(
+            [
+                load_collection(self.db.spotify, SPOTIFY_SCHEMA, changed["spotify"]),
+                load_collection(
+                    self.db.spotify_nillboard,
+                    NILLBOARD_SCHEMA,
+                    changed["spotify_nillboard"],
+                ),
+            ]
         )
+        lyrics = load_collection(self.db.lyrics, LYRICS_SCHEMA, changed["lyrics"])
+        albums = load_collection(
+            self.db.spotify_albums, ALBUM_SCHEMA, changed["spotify_albums"]
+        )
+        hot100 = load_collection(
+            self.db.hot100filtered, HOT100_SCHEMA, changed["hot100filtered"]
+        )
+
+        # changed lyrics, albums and Hot 100 entries overwrite joined rows
+        affected = self.df.track_id.isin(tracks.track_id)
+        affected |= self._update_rows("track_id", lyrics)
+        affected |= self._update_rows("album_id", albums)
+        affected |= self._update_rows("obj_id", hot100)
+
+        # new and changed tracks are joined with their data and replace rows
+        if len(tracks):
+            obj_ids = [i for i in tracks.obj_id.unique() if i is not None]
+            rows = merge_tracks(
+                tracks,
+                load_ids(self.db.lyrics, LYRICS_SCHEMA, tracks.track_id, LYRICS_QUERY),
+                load_ids(
+                    self.db.spotify_albums, ALBUM_SCHEMA, tracks.album_id.unique()
+                ),
+                load_ids(self.db.hot100filtered, HOT100_SCHEMA, obj_ids),
+            )
+            kept = ~self.df.track_id.isin(rows.track_id)
+            self.df = concat_frames([self.df[kept], rows])
+            affected = np.concatenate(
+                [affected[kept].values, np.ones(len(rows), dtype=bool)]
+            )
+
+        # recompute derived columns for the affected rows only
+        affected = np.asarray(affected)
+        if "release_year" in self.df.columns and affected.any():
+            rows = self.df[affected]
+            year, month = release_parts(rows.release_date, rows.release_date_precision)
+            self.df.loc[affected, "release_year"] = year.values
+            self.df.loc[affected, "release_month"] = month.values
+            self.df["release_year"] = self.df.release_year.astype(year.dtype)
+
+        self.watermarks = marks
+        if cache_dir:
+            self.save_snapshot(cache_dir)
+        return {
+            "tracks": len(tracks),
+            "lyrics": len(lyrics),
+            "spotify_albums": len(albums),
+            "hot100filtered": len(hot100),
+        }
+
+    def _update_rows(self, key, frame):
+        """
+        Overwrites the columns of frame in the rows of self.df with a
+        matching key.
+
+        Args:
+            key (str): column to match rows on
+            frame (Pandas DataFrame): new values, including the key column
+
+        Returns: (Pandas Series of bool) the rows that were updated.
+        """
+        frame = frame.drop_duplicates(key, keep="last").set_index(key)
+        mask = self.df[key].isin(frame.index)
+        if not mask.any():
+            return mask
+        for col in frame.columns:
+            values = self.df.loc[mask, key].map(frame[col])
+            if isinstance(self.df[col].dtype, pd.CategoricalDtype):
+                values = values.astype(object)
+                new = pd.Index(values.dropna().unique())
+                new = new.difference(self.df[col].cat.categories)
+                self.df[col] = self.df[col].cat.add_categories(new)
+            self.df.loc[mask, col] = values.values
+        return mask
 
     def load_spotify_billboard_data(self):
         """
@@ -46,67 +762,7 @@ class BillboardData:
 
         Returns: Dataframe of the Spotify Billboard Data. 
         """
-        return pd.DataFrame(
-            map(
-                lambda r: [
-                    r["metadata"]["artists"][0]["name"],
-                    r["metadata"]["album"]["id"],
-                    r["metadata"]["album"]["album_type"],
-                    r["metadata"]["album"]["total_tracks"],
-                    r["metadata"]["album"]["release_date"],
-                    r["metadata"]["album"]["release_date_precision"],
-                    r["metadata"]["disc_number"],
-                    r["metadata"]["duration_ms"],
-                    r["metadata"]["explicit"],
-                    r["metadata"]["id"],
-                    r["metadata"]["name"],
-                    r["metadata"]["popularity"],
-                    r["metadata"]["track_number"],
-                    r["audio_features"]["danceability"],
-                    r["audio_features"]["energy"],
-                    r["audio_features"]["acousticness"],
-                    r["audio_features"]["key"],
-                    r["audio_features"]["loudness"],
-                    r["audio_features"]["mode"],
-                    r["audio_features"]["speechiness"],
-                    r["audio_features"]["instrumentalness"],
-                    r["audio_features"]["liveness"],
-                    r["audio_features"]["valence"],
-                    r["audio_features"]["tempo"],
-                    r["audio_features"]["time_signature"],
-                    r["_id"],
-                ],
-                self.db.spotify.find(),
-            ),
-            columns=[
-                "artist",
-                "album_id",
-                "album_type",
-                "total_tracks",
-                "release_date",
-                "release_date_precision",
-                "disc_number",
-                "duration_ms",
-                "explicit",
-                "track_id",
-                "title",
-                "popularity",
-                "track_number",
-                "danceability",
-                "energy",
-                "acousticness",
-                "key",
-                "loudness",
-                "mode",
-                "speechiness",
-                "instrumentalness",
-                "liveness",
-                "valence",
-                "tempo",
-                "time_signature",
-                "obj_id",
-            ],
-        )
+        return load_collection(self.db.spotify, SPOTIFY_SCHEMA)
 
     def load_spotify_nillboard_data(self):
         """
@@ -114,94 +770,17 @@ class BillboardData:
 
         Returns: Dataframe of the Spotify Nillboard.
         """
-
-        return pd.DataFrame(
-            map(
-                lambda r: [
-                    r["metadata"]["artists"][0]["name"],
-                    r["metadata"]["album"]["id"],
-                    r["metadata"]["album"]["album_type"],
-                    r["metadata"]["album"]["total_tracks"],
-                    r["metadata"]["album"]["release_date"],
-                    r["metadata"]["album"]["release_date_precision"],
-                    r["metadata"]["disc_number"],
-                    r["metadata"]["duration_ms"],
-                    r["metadata"]["explicit"],
-                    r["metadata"]["id"],
-                    r["metadata"]["name"],
-                    r["metadata"]["popularity"],
-                    r["metadata"]["track_number"],
-                    r["audio_features"]["danceability"],
-                    r["audio_features"]["energy"],
-                    r["audio_features"]["acousticness"],
-                    r["audio_features"]["key"],
-                    r["audio_features"]["loudness"],
-                    r["audio_features"]["mode"],
-                    r["audio_features"]["speechiness"],
-                    r["audio_features"]["instrumentalness"],
-                    r["audio_features"]["liveness"],
-                    r["audio_features"]["valence"],
-                    r["audio_features"]["tempo"],
-                    r["audio_features"]["time_signature"],
-                    None,  # no obj_id because these tracks were not on the billboard.
-                ],
-                self.db.spotify_nillboard.find(),
-            ),
-            columns=[
-                "artist",
-                "album_id",
-                "album_type",
-                "total_tracks",
-                "release_date",
-                "release_date_precision",
-                "disc_number",
-                "duration_ms",
-                "explicit",
-                "track_id",
-                "title",
-                "popularity",
-                "track_number",
-                "danceability",
-                "energy",
-                "acousticness",
-                "key",
-                "loudness",
-                "mode",
-                "speechiness",
-                "instrumentalness",
-                "liveness",
-                "valence",
-                "tempo",
-                "time_signature",
-                "obj_id",
-            ],
-        )
+        return load_collection(self.db.spotify_nillboard, NILLBOARD_SCHEMA)
 
     def load_lyrics_data(self):
         """
         Loads all the lyrics data.
         Returns: Dataframe of the lyrics data (lyrics not included).
         """
-        return pd.DataFrame(
-            map(
-                lambda r: [
-                    r["_id"],
-                    r["response_artist"],
-                    r["response_title"],
-                    r["dict_sentiment"]["pos"],
-                    r["dict_sentiment"]["neg"],
-                    r["dict_sentiment"]["wordcount"],
-                ],
-                self.db.lyrics.find({"dict_sentiment.wordcount": {"$exists": "true"}}),
-            ),
-            columns=[
-                "track_id",
-                "response_artist",
-                "response_title",
-                "poscount",
-                "negcount",
-                "wordcount",
-            ],
+        return load_collection(
+            self.db.lyrics,
+            LYRICS_SCHEMA,
+            query=LYRICS_QUERY,
         )
 
     def load_hot_100_data(self):
@@ -209,27 +788,7 @@ class BillboardData:
         Loads the Billboard Hot 100 data.
         Returns: Dataframe of the Hot 100 data.
         """
-        return pd.DataFrame(
-            map(
-                lambda r: [
-                    r["_id"],
-                    r["artist"],
-                    r["title"],
-                    r["date"],
-                    r["peakPos"],
-                    r["weeks"],
-                ],
-                self.db.hot100filtered.find(),
-            ),
-            columns=[
-                "obj_id",
-                "bb_artist",
-                "bb_title",
-                "date_entered_bb",
-                "peakPos",
-                "weeks",
-            ],
-        )
+        return load_collection(self.db.hot100filtered, HOT100_SCHEMA)
 
     def load_spotify_album_data(self):
         """
@@ -239,13 +798,95 @@ class BillboardData:
         Returns: Dataframe of the album data. 
         """
         # None of the genres are filled
-        return pd.DataFrame(
-            map(
-                lambda r: [r["_id"], r["label"], r["popularity"]],
-                self.db.spotify_albums.find(),
-            ),
-            columns=["album_id", "label", "album_popularity",],
+        return load_collection(self.db.spotify_albums, ALBUM_SCHEMA)
+
+    def iter_chunks(self, chunk_size=50000, drop_no_lyrics=True, scale=True):
+        """
+        Streams the data in transformed chunks instead of loading it all
+        into self.df, for training incremental learners or an XGBoost
+        external-memory DMatrix on catalogs bigger than RAM. A first pass
+        fits self.label_encoder on the labels of the Billboard tracks. Then
+        Billboard and Nillboard tracks are read chunk_size at a time, joined
+        with their lyrics, album and Hot 100 data, and put through
+        transform_for_models, the label hit counts and scale.
+
+        Args:
+            chunk_size (int): tracks per chunk. Default 50000
+            drop_no_lyrics (bool): drop tracks without lyrics, as
+                drop_no_lyrics does. Default True
+            scale (bool): apply scale to each chunk. Default True
+
+        Yields: Pandas DataFrame with the columns of a transformed self.df.
+        """
+        # first pass: label hit counts from the Billboard tracks
+        hits = load_collection(
+            self.db.spotify,
+            tuple(f for f in SPOTIFY_SCHEMA if f[0] in ("track_id", "album_id")),
         )
+        if drop_no_lyrics:
+            with_lyrics = load_ids(
+                self.db.lyrics,
+                LYRICS_SCHEMA[:1],
+                hits.track_id,
+                LYRICS_QUERY,
+                batch_size=chunk_size,
+            )
+            hits = hits[hits.track_id.isin(with_lyrics.track_id)]
+        albums = load_ids(
+            self.db.spotify_albums,
+            ALBUM_SCHEMA,
+            hits.album_id.unique(),
+            batch_size=chunk_size,
+        )
+        labels = hits.merge(albums, how="left", on="album_id").label
+        self.label_encoder = LabelHitcountEncoder().fit(
+            labels, np.ones(len(labels), dtype=bool)
+        )
+
+        # second pass: joined and transformed chunks
+        for collection, schema in (
+            (self.db.spotify, SPOTIFY_SCHEMA),
+            (self.db.spotify_nillboard, NILLBOARD_SCHEMA),
+        ):
+            cursor = collection.find(
+                {}, schema_projection(schema), batch_size=chunk_size
+            )
+            while True:
+                tracks = decode_cursor(islice(cursor, chunk_size), schema, chunk_size)
+                if not len(tracks):
+                    break
+                obj_ids = [i for i in tracks.obj_id.unique() if i is not None]
+                chunk = BillboardData(self.db)
+                chunk.df = merge_tracks(
+                    tracks,
+                    load_collection(
+                        self.db.lyrics,
+                        LYRICS_SCHEMA,
+                        {
+                            "$and": [
+                                LYRICS_QUERY,
+                                {"_id": {"$in": list(tracks.track_id)}},
+                            ]
+                        },
+                    ),
+                    load_collection(
+                        self.db.spotify_albums,
+                        ALBUM_SCHEMA,
+                        {"_id": {"$in": list(tracks.album_id.unique())}},
+                    ),
+                    load_collection(
+                        self.db.hot100filtered,
+                        HOT100_SCHEMA,
+                        {"_id": {"$in": obj_ids}},
+                    ),
+                )
+                if drop_no_lyrics:
+                    chunk.drop_no_lyrics()
+                chunk.transform_for_models()
+                chunk.df.label = self.label_encoder.transform(chunk.df.label)
+                if scale:
+                    chunk.scale()
+                yield chunk.df
 
     def drop_no_lyrics(self):
         """
@@ -254,6 +895,39 @@ class BillboardData:
         haslyrics = ~self.df.response_title.isna()
         self.df = self.df[haslyrics].reset_index(drop=True)
 
+    def memory_report(self):
+        """
+        Reports the memory used by each column of self.df next to what it
+        would use with the default int64, float64 and object dtypes.
+
+        Returns: Dataframe of dtype, bytes and default_bytes per column, with
+        a total row.
+        """
+        rows = []
+        for col in self.df.columns:
+            column = self.df[col]
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                default = column.astype(object)
+            elif pd.api.types.is_float_dtype(column):
+                default = column.astype(np.float64)
+            elif pd.api.types.is_integer_dtype(column):
+                default = column.astype(np.int64)
+            else:
+                default = column
+            rows.append(
+                (
+                    col,
+                    str(column.dtype),
+                    column.memory_usage(index=False, deep=True),
+                    default.memory_usage(index=False, deep=True),
+                )
+            )
+        report = pd.DataFrame(
+            rows, columns=["column", "dtype", "bytes", "default_bytes"]
+        ).set_index("column")
+        report.loc["total"] = ["", report.bytes.sum(), report.default_bytes.sum()]
+        return report
+
     def split_test(self, test_size=0.1, rstate=None):
         """
         Splits off a portion of the data for testing.
@@ -270,24 +944,21 @@ class BillboardData:
 
     def transform_for_models(self):
         """
-        Transforms self.df for machine learning models. 
+        Transforms self.df for machine learning models. release_month is NaN
+        for release dates without day precision, or -1 if balance_class_year
+        already added it.
         """
 
         # Makes the target column
         self.df["on_billboard"] = ~self.df.obj_id.isna()
 
-        # converts the date-string to a datetime
-        self.df.release_date = pd.to_datetime(self.df.release_date, format="%Y-%m-%d")
-
         # breaks out the year and month from the date
         if "release_year" not in self.df.columns:
-            self.df["release_year"] = self.df.release_date.apply(lambda dt: dt.year)
-            self.df["release_month"] = self.df.apply(
-                lambda r: r.release_date.month
-                if r.release_date_precision == "day"
-                else np.nan,
-                axis=1,
+            year, month = release_parts(
+                self.df.release_date, self.df.release_date_precision
             )
+            self.df["release_year"] = year
+            self.df["release_month"] = month
 
         # computes the lyrical sentiment from the related fields.
         self.df["lyric_sentiment"] = (self.df.poscount - self.df.negcount) / (
@@ -295,12 +966,11 @@ class BillboardData:
         )
 
         # Computes the track placement
-        self.df["track_placement"] = self.df.apply(
-            lambda r: (r.track_number / r.total_tracks + 1 - 1 / r.disc_number)
-            if r.total_tracks > 1
-            else -1,  # no sense in adding singles to track placement
-            axis=1,
-        )
+        self.df["track_placement"] = np.where(
+            self.df.total_tracks > 1,
+            self.df.track_number / self.df.total_tracks + 1 - 1 / self.df.disc_number,
+            -1,  # no sense in adding singles to track placement
+        ).astype(np.float32)
 
         # Drop unneeded columns
         self.df.drop(
@@ -328,52 +998,40 @@ class BillboardData:
             inplace=True,
         )
 
-    def balance_class_year(self, rseed=None):
+    def balance_class_year(self, rseed=None, ratio=1.0):
         """
         Balances target class of self.df by year using random sampling. 
 
         Args: 
-            rseed (int): numpy random seed used for reproducibility. Seed is 
-            reset after sampling.
+            rseed (int or numpy Generator): seed for reproducibility. The
+            global numpy random state is not touched.
+            ratio (float): Nillboard tracks to keep per Billboard track in
+            each year. Default 1.0
+
+        Returns: (numpy ndarray) positions of the kept rows in the old self.df
         """
 
+        # months of dates without day precision are -1 here, as they always
+        # were when balancing ran before transform_for_models
         if "release_year" not in self.df.columns:
-            self.df.release_date = pd.to_datetime(
-                self.df.release_date, format="%Y-%m-%d"
-            )
-            self.df["release_year"] = self.df.release_date.apply(lambda dt: dt.year)
-            self.df["release_month"] = self.df.apply(
-                lambda r: r.release_date.month
-                if r.release_date_precision == "day"
-                else -1,
-                axis=1,
+            year, month = release_parts(
+                self.df.release_date, self.df.release_date_precision, -1
             )
-        # separate classes temporarily
-        bbmask = ~self.df.obj_id.isna()
-        bbdf = self.df[bbmask]
-        nbdf = self.df[~bbmask]
-
-        # get target counts for each year
-        yearcounts = bbdf.groupby("release_year").count()["energy"].to_dict()
-
-        # actually do the random sampling
-        chosen_ids = []
-        np.random.seed(rseed)
-        for year in range(2000, 2020):
-            avail_ids = nbdf[nbdf.release_year == year]["track_id"].values
-            chosen_ids.extend(
-                np.random.choice(avail_ids, yearcounts[year], replace=False)
-            )
-
-        chosen_ids = set(chosen_ids)
-        nbdf = nbdf[nbdf.track_id.apply(lambda i: i in chosen_ids)]
+            self.df["release_year"] = year
+            self.df["release_month"] = month
 
-        self.df = bbdf.append(nbdf, ignore_index=True, sort=False)
+        if "on_billboard" in self.df.columns:
+            on_billboard = self.df.on_billboard
+        else:
+            on_billboard = ~self.df.obj_id.isna()
 
-        # reset random seed
-        np.random.seed(None)
+        keep = balanced_year_sample(
+            self.df.release_year, on_billboard, ratio, np.random.default_rng(rseed)
+        )
+        self.df = self.df.iloc[keep].reset_index(drop=True)
+        return keep
 
-    def transform_label_to_hitcount(self, testdf=None):
+    def transform_label_to_hitcount(self, testdf=None, handle_unknown="zero"):
         """
         Transforms the record label names to the number of hits they have 
         on the billboard. This is a post test-train-split transform.
@@ -381,32 +1039,23 @@ class BillboardData:
         Args:
             testdf (Pandas DataFrame): test split data if it needs to be transformed. 
             Default None, which transforms the internal (training) data.
+            handle_unknown (str): see LabelHitcountEncoder. Only used in
+            train mode. Default 'zero'
 
         Returns: None if testdf is None, the transformed DataFrame otherwise
         """
 
-        # train mode. 
-        if type(testdf)==type(None):
-            self.df.label = self.df.label.apply(
-                lambda l: ["".join(lword.split()).lower() for lword in l.split("/")]
+        # train mode.
+        if testdf is None:
+            self.label_encoder = LabelHitcountEncoder(handle_unknown)
+            self.df.label = self.label_encoder.fit_transform(
+                self.df.label, self.df.on_billboard
             )
-            hitdf = self.df[self.df.on_billboard == 1]
-
-            self.label_hitcount = Counter(reduce(add, hitdf.label.values))
+            self.label_hitcount = Counter(self.label_encoder.hitcounts_.to_dict())
 
-            self.df.label = self.df.label.apply(
-                lambda l: np.mean([self.label_hitcount[lab] for lab in l])
-            ).astype(int)
-        
         # test mode
-        else: 
-            testdf.label = testdf.label.apply(
-                lambda l: ["".join(lword.split()).lower() for lword in l.split("/")]
-            )
-
-            testdf.label = testdf.label.apply(
-                lambda l: np.mean([self.label_hitcount[lab] for lab in l])
-            ).astype(int)
+        else:
+            testdf.label = self.label_encoder.transform(testdf.label)
             return testdf
 
     def scale(self):
@@ -424,7 +1073,7 @@ class BillboardData:
         }
         for col in self.df.columns:
             if col in scale_f:
-                self.df[col] = self.df[col].apply(scale_f[col])
+                self.df[col] = scale_f[col](self.df[col])
 
     def drop_popularities(self):
         """
@@ -0,0 +1,166 @@
+import threading, time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+# default rate ceiling as a multiple of the starting rate, the headroom the
+# additive increase has to find a faster rate than the one configured
+MAX_RATE_FACTOR = 4
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter with additive-increase/multiplicative-decrease
+    (AIMD) adjustment, shared by the scrapers. Callers take a token before
+    each request, then report whether the API accepted it: every success
+    raises the rate a little, every throttle (429, timeout) cuts it, and a
+    Retry-After pauses all callers. Safe to share across threads.
+
+    Args:
+        rate (float): starting requests per second. float('inf') disables
+            limiting until the first throttle. Default 1.0
+        min_rate (float): rate floor. Default 0.05
+        max_rate (float): rate ceiling. Default None, MAX_RATE_FACTOR times
+            the starting rate.
+        increase (float): requests per second added per success. Default 0.01
+        decrease (float): factor the rate is multiplied by per throttle.
+            Default 0.5
+        burst (int): tokens that can build up while idle. Default 1
+    """
+
+    def __init__(
+        self,
+        rate=1.0,
+        min_rate=0.05,
+        max_rate=None,
+        increase=0.01,
+        decrease=0.5,
+        burst=1,
+    ):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate if max_rate is not None else rate * MAX_RATE_FACTOR
+        self.increase = increase
+        self.decrease = decrease
+        self.burst = burst
+
+        self._lock = threading.Lock()
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._started = None
+        self.requests = 0
+        self.throttles = 0
+
+    def _reserve(self):
+        """
+        Takes a token, going into debt if none are left.
+
+        Args: None
+
+        Returns: (float) seconds the caller must wait before its request.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._started is None:
+                self._started = now
+            self.requests += 1
+            wait = max(0.0, self._paused_until - now)
+            if self.rate == float("inf"):
+                return wait
+            elapsed = now - self._updated
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate) - 1
+            self._updated = now
+            if self._tokens < 0:
+                wait = max(wait, -self._tokens / self.rate)
+            return wait
+
+    def acquire(self):
+        """
+        Blocks the calling thread until a request may be made.
+
+        Args: None
+
+        Returns: None
+        """
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def success(self):
+        """
+        Records an accepted request, raising the rate additively.
+
+        Args: None
+
+        Returns: None
+        """
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def throttled(self, retry_after=None):
+        """
+        Records a rejected or timed out request, cutting the rate
+        multiplicatively and pausing all callers for retry_after.
+
+        Args:
+            retry_after (float or str): seconds to pause, or the value of a
+                Retry-After header. Default None, no pause.
+
+        Returns: None
+        """
+        pause = retry_after_seconds(retry_after)
+        with self._lock:
+            self.throttles += 1
+            rate = self.rate if self.rate != float("inf") else 1 / max(pause, 1)
+            self.rate = max(self.min_rate, rate * self.decrease)
+            self._tokens = min(self._tokens, 0)
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+
+    def effective_rate(self):
+        """
+        The average rate requests have been let through since the first one.
+
+        Args: None
+
+        Returns: (float) requests per second.
+        """
+        with self._lock:
+            if self._started is None:
+                return 0.0
+            elapsed = time.monotonic() - self._started
+            return self.requests / elapsed if elapsed > 0 else float("inf")
+
+    def report(self):
+        """
+        Describes the current and effective rates.
+
+        Args: None
+
+        Returns: (str) one-line summary.
+        """
+        return (
+            f"rate limit {self.rate:.2f}/s, effective {self.effective_rate():.2f}/s "
+            f"over {self.requests} requests, {self.throttles} throttled"
+        )
+
+
+def retry_after_seconds(value):
+    """
+    Parses a Retry-After value, which is either seconds or an HTTP date.
+
+    Args:
+        value (float, str or None): the header value
+
+    Returns: (float) seconds to wait, 0 if value is None or unparseable.
+    """
+    if value is None:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        until = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return max(0.0, (until - datetime.now(timezone.utc)).total_seconds())
@@ -1,12 +1,16 @@
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
+from spotipy.exceptions import SpotifyException
+from src.rate_limiter import RateLimiter
+from src.bulk_writer import BulkWriter
+from src import http_cache
+from src.backlog import anti_join, album_track_backlog
 
 import pandas as pd
 from pymongo import MongoClient
-import time, sys, string
-from urllib.parse import urlparse, parse_qs
+import asyncio, threading, time, sys, string
+from concurrent.futures import ThreadPoolExecutor
 
-from pymongo.errors import BulkWriteError, DuplicateKeyError
 
 
 class Spotify_Scraper:
@@ -14,100 +18,177 @@ class Spotify_Scraper:
     Scraper using spotipy to gather information from the Spotify API.
 
     Args:
-        sleeptime (float): seconds to wait between queries. Default 0.5
+        sleeptime (float): starting seconds between queries, used when no
+            limiter is given. Default 0.5
+        sp (spotipy.Spotify): client to use instead of one authorized from
+            data/spotify.auth. Default None
+        db (pymongo Database): database to use instead of the local
+            billboard database. Default None
+        limiter (RateLimiter): rate limiter for all Spotify API calls, which
+            may be shared with other scrapers. Calls answered by the cache
+            don't wait. Default None, a new one starting at 1/sleeptime
+            calls per second.
+        cache (ResponseCache): cache for Spotify API responses. In offline
+            mode no credentials are needed. Default None, no caching.
+        use_index (bool): look searches up in a MatchIndex of earlier
+            results before calling the API. Default True
     """
 
-    def __init__(self, sleeptime=0.5):
+    def __init__(
+        self, sleeptime=0.5, sp=None, db=None, limiter=None, cache=None, use_index=True
+    ):
 
         # get Spotify API tokens
         self.sleeptime = sleeptime
-        with open("data/spotify.auth", "r") as f:
-            client_id = f.readline().strip()
-            client_secret = f.readline().strip()
-
-        client_credentials_manager = SpotifyClientCredentials(
-            client_id=client_id, client_secret=client_secret
-        )
-        self.sp = spotipy.Spotify(client_credentials_manager=client_credentials_manager)
+        if limiter is None:
+            rate = 1 / sleeptime if sleeptime else float("inf")
+            limiter = RateLimiter(rate=rate, max_rate=max(rate, 10.0))
+        self.limiter = limiter
+        if sp is None and cache is not None and cache.offline:
+            sp = spotipy.Spotify(auth="offline")
+        elif sp is None:
+            with open("data/spotify.auth", "r") as f:
+                client_id = f.readline().strip()
+                client_secret = f.readline().strip()
+
+            client_credentials_manager = SpotifyClientCredentials(
+                client_id=client_id, client_secret=client_secret
+            )
+            sp = spotipy.Spotify(client_credentials_manager=client_credentials_manager)
+        if cache is not None:
+            http_cache.install(sp._session, cache, limiter)
+        self.sp = sp
+        self.cache = cache
         print("Connected to Spotify")
 
-        self.db = MongoClient().billboard
+        self.db = db if db is not None else MongoClient().billboard
+        # track and album documents are stamped on write for BillboardData.refresh
+        self.writers = {
+            name: BulkWriter(self.db[name], stamp=stamp)
+            for name, stamp in (
+                ("spotify", "scraped"),
+                ("spotify_errlog", None),
+                ("spotify_albums", "scraped"),
+                ("spotify_nillboard", "scraped"),
+            )
+        }
+        self.match_index = MatchIndex(self.db) if use_index else None
         print("Connected to MongoDB")
 
-    def populate_bb_scrapables(self):
+    def populate_bb_scrapables(self, queue=None):
         """
         Identifies and populates the tracks to scrape from the 
         billboard.hot100filtered collection.
 
+        Args:
+            queue (JobQueue): queue to also add the tracks to as
+                'spotify_bb' jobs, for work_queue. Default None
+
         Returns: None. Saves track information to an object state.
         """
-        to_scrape = [
-            track for track in self.db.hot100filtered.find({"_id": {"$exists": "true"}})
-        ]
-        print(f"Billboard tracks:    {len(to_scrape)}")
-
-        spot_ids = {
-            track["_id"]
-            for track in self.db["spotify"].find(
-                {"_id": {"$exists": "true"}}, {"_id": "true"}
+        n_billboard = self.db.hot100filtered.estimated_document_count()
+        print(f"Billboard tracks:    {n_billboard}")
+        self.to_scrape = list(
+            anti_join(
+                self.db.hot100filtered,
+                [(self.db.spotify, "_id")],
+                query={"date": {"$gt": "2000"}},
+                projection={"artist": 1, "title": 1, "date": 1},
             )
-        }
-
-        self.to_scrape = []
-        for track in to_scrape:
-            if (track["_id"] not in spot_ids) & (track["date"] > "2000"):
-                self.to_scrape.append(track)
+        )
         print(f"Remaining to scrape: {len(self.to_scrape)}")
 
-    def add_full_bb_albums(self, verbose=1):
+        if queue is not None:
+            added = queue.enqueue(
+                "spotify_bb",
+                (
+                    (
+                        str(t["_id"]),
+                        {"_id": t["_id"], "artist": t["artist"], "title": t["title"]},
+                    )
+                    for t in self.to_scrape
+                ),
+            )
+            print(f"Jobs queued:         {added}")
+
+    def add_full_bb_albums(self, verbose=1, workers=8):
         """
         Scrapes full album data from Spotify given that billboard.spotify is populated.
+        Each album not yet in billboard.spotify_albums is fetched once, 20 per
+        call, and the extra pages of long track lists are fetched concurrently.
 
         Args: 
             verbose (int): how much to print. Default 1
+            workers (int): track list pages fetched at once. Default 8
 
         Returns: None, but saves albums to billboard.spotify_albums 
         """
-        to_scrape = [track["metadata"]["album"] for track in self.db.spotify.find()]
+        album_ids = self.db.spotify.distinct("metadata.album.id")
+        scraped = {a["_id"] for a in self.db.spotify_albums.find({}, {"_id": 1})}
+        to_scrape = [album_id for album_id in album_ids if album_id not in scraped]
         num_albums = len(to_scrape)
-        duplicates = 0
-        for i, album in enumerate(to_scrape):
-            album_id = album["id"]
-            full_album = self.sp.album(album_id)
-            next_tracks = full_album["tracks"]["next"]
-            while next_tracks:
-                offsetn = int(parse_qs(urlparse(next_tracks).query)["offset"][0])
-                remaining_tracks = self.sp.album_tracks(album_id, offset=offsetn)
-                full_album["tracks"]["items"].extend(remaining_tracks["items"])
-                next_tracks = remaining_tracks["next"]
-            full_album["_id"] = full_album.pop("id")
-            try:
-                self.db["spotify_albums"].insert_one(full_album)
-            except DuplicateKeyError:
-                duplicates += 1
-            if verbose:
-                print(f"Full Album {i}/{num_albums} scraped")
-        print(f"Duplicates encountered: {duplicates}")
+        if verbose:
+            print(f"Albums: {len(album_ids)}, already scraped: {len(scraped)}")
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for i in range(0, num_albums, 20):
+                albums = self.call_api(self.sp.albums, to_scrape[i : i + 20])
+                albums = [album for album in albums["albums"] if album]
+                pages = pool.map(self._album_tracks_after_first_page, albums)
+                for full_album, remaining in zip(albums, pages):
+                    full_album["tracks"]["items"].extend(remaining)
+                    full_album["tracks"]["next"] = None
+                    full_album["_id"] = full_album.pop("id")
+                    self.writers["spotify_albums"].add(full_album)
+                if verbose:
+                    print(f"Full Albums {min(i + 20, num_albums)}/{num_albums} scraped")
+        self.flush_writes()
+        print(f'Duplicates encountered: {self.writers["spotify_albums"].duplicates}')
+
+    def _album_tracks_after_first_page(self, album):
+        """
+        Helper method for add_full_bb_albums that gets the tracks of an album
+        beyond the first page returned with it, one call per further page.
+
+        Args:
+            album (dict): album from the Spotify API
+
+        Returns: (list of dicts) the remaining tracks, in order.
+        """
+        tracks = album["tracks"]
+        items = []
+        for offset in range(len(tracks["items"]), tracks["total"], 50):
+            page = self.call_api(
+                self.sp.album_tracks, album["id"], limit=50, offset=offset
+            )
+            items.extend(page["items"])
+        return items
 
-    def populate_nillboard_scrapables(self, verbose=1):
+    def populate_nillboard_scrapables(self, verbose=1, queue=None):
         """
         Identifies and saves the nillboard tracks to scrape from the 
-        non-billboard tracks in the scraped albums. 
+        non-billboard tracks in the scraped albums that are not yet in
+        billboard.spotify_nillboard.
 
         Args: 
             verbose (int): how much to print. Default 1
+            queue (JobQueue): queue to also add the tracks to as
+                'spotify_nillboard' jobs, for work_queue. Default None
 
         Returns: None, but changes internal state.
         """
-        track_ids = []
-        for album in self.db.spotify_albums.find():
-            track_ids.extend([track["id"] for track in album["tracks"]["items"]])
-        billboard_ids = {track["metadata"]["id"] for track in self.db.spotify.find()}
-        self.to_scrape = list(set(track_ids) - billboard_ids)
+        self.to_scrape = list(album_track_backlog(self.db))
 
         if verbose:
             print(f"Nillboard tracks to scrape: {len(self.to_scrape)}")
 
+        if queue is not None:
+            added = queue.enqueue(
+                "spotify_nillboard", ((t, {"id": t}) for t in self.to_scrape)
+            )
+            if verbose:
+                print(f"Jobs queued: {added}")
+
     def scrape_nillboard_tracks(self, verbose=1):
         """
         Scrapes tracks from Spotify given that internal state has been populated.
@@ -126,6 +207,41 @@ class Spotify_Scraper:
         if i < end:
             bundle = self.to_scrape[i:end]
             self._scrape_nillboard_tracks_by_id_bundle(bundle)
+        self.flush_writes(verbose)
+
+    def work_queue(self, queue, kind="spotify_bb", hook=None, hkwargs=None, verbose=1):
+        """
+        Scrapes jobs from a shared queue, 50 at a time, until none are left.
+        Any number of processes can work the same queue.
+
+        Args:
+            queue (JobQueue): queue filled by populate_bb_scrapables or
+                populate_nillboard_scrapables
+            kind (str): 'spotify_bb' or 'spotify_nillboard'. Default
+                'spotify_bb'
+            hook (function): for 'spotify_bb', used to process the list of
+                dicts before inserting the documents into MongoDB.
+            hkwargs (dict): Keyword arguments for the hook. Default None,
+                none.
+            verbose (int): how much to print. Default 1
+
+        Returns: None, but saves data to billboard.spotify or
+        billboard.spotify_nillboard.
+        """
+        hkwargs = hkwargs or {}
+        while True:
+            with queue.lease(kind, 50) as jobs:
+                if not jobs:
+                    break
+                self.to_scrape = [job["payload"] for job in jobs]
+                if kind == "spotify_bb":
+                    self.scrape_all(hook, hkwargs, verbose)
+                else:
+                    bundle = [track["id"] for track in self.to_scrape]
+                    self._scrape_nillboard_tracks_by_id_bundle(bundle)
+                    self.flush_writes(verbose)
+            if verbose:
+                print(queue.counts(kind))
 
     def _scrape_nillboard_tracks_by_id_bundle(self, id_bundle):
         """
@@ -137,8 +253,8 @@ class Spotify_Scraper:
 
         Returns: None, but saves track information to billboard.spotify_nillboard
         """
-        metadata = self.sp.tracks(id_bundle)
-        audio_features = self.sp.audio_features(id_bundle)
+        metadata = self.call_api(self.sp.tracks, id_bundle)
+        audio_features = self.call_api(self.sp.audio_features, id_bundle)
         af = dict()
         for a in audio_features:
             if a:
@@ -152,7 +268,34 @@ class Spotify_Scraper:
                 track["audio_features"] = af[track_id]
             track["_id"] = track_id
             tracks.append(track)
-        self.db["spotify_nillboard"].insert_many(tracks)
+        self.writers["spotify_nillboard"].extend(tracks)
+
+    def call_api(self, f, *args, retries=5, **kwargs):
+        """
+        Calls a spotipy method under self.limiter. Rate limit responses (429)
+        slow the limiter down, honoring Retry-After, and are retried. With a
+        cache, the session takes the token only if the call misses it.
+
+        Args:
+            f (function): spotipy method, e.g. self.sp.search
+            args: positional arguments for f
+            retries (int): max retries after a 429. Default 5
+            kwargs: keyword arguments for f
+
+        Returns: the result of f.
+        """
+        for attempt in range(retries + 1):
+            if self.cache is None:
+                self.limiter.acquire()
+            try:
+                result = f(*args, **kwargs)
+            except SpotifyException as e:
+                if e.http_status != 429 or attempt == retries:
+                    raise
+                self.limiter.throttled((e.headers or {}).get("Retry-After"))
+                continue
+            self.limiter.success()
+            return result
 
     def get_spotify_track(self, artist, trackname):
         """
@@ -165,12 +308,12 @@ class Spotify_Scraper:
         Returns: dict of track information or None if no results found.
         """
         artist = stripFeat(artist)
-        result = self.sp.search(f"artist:{artist} track:{trackname}")
+        result = self.call_api(self.sp.search, f"artist:{artist} track:{trackname}")
 
         # if no result, strip punctuation and try again
         if result["tracks"]["total"] == 0:
             trackname = trackname.translate(str.maketrans("", "", string.punctuation))
-            result = self.sp.search(f"artist:{artist} track:{trackname}")
+            result = self.call_api(self.sp.search, f"artist:{artist} track:{trackname}")
             if result["tracks"]["total"] == 0:
                 return None
 
@@ -189,33 +332,158 @@ class Spotify_Scraper:
 
         Returns: None, but saves data to billboard.spotify collection.
         """
-        i = 0
-        num_tracks = len(self.to_scrape)
-        while i < num_tracks:
-            prev_i = i
-            tracks_arr = []
-            err_arr = []
-            while (i - prev_i < 50) & (i < num_tracks):
-                row = self.to_scrape[i]
-                _id = row["_id"]
-                trackdata = self.get_spotify_track(row["artist"], row["title"])
-                if trackdata == None:
-                    err_arr.append({"_id": _id, "msg": "No Spotify data"})
-                else:
-                    tracks_arr.append({"_id": _id, "metadata": trackdata})
-                i += 1
+        for start in range(0, len(self.to_scrape), 50):
+            wave = self.to_scrape[start : start + 50]
+            keys, found, to_search = self._plan_wave(wave)
+            for i, (key, row) in enumerate(to_search.items()):
+                found[key] = self.get_spotify_track(row["artist"], row["title"])
                 if verbose == 2:
-                    print(i)
-                time.sleep(self.sleeptime)
-            URIlist = list(map(lambda x: x["metadata"]["uri"], tracks_arr))
+                    print(start + i)
+            tracks_arr, err_arr = self._resolve_wave(wave, keys, found, to_search)
             if verbose:
-                print(f"__index: {i}")
+                print(f"__index: {start + len(wave)}")
+                print(f"Searched: {len(to_search)}")
                 print(f"Scraped: {len(tracks_arr)}")
                 print(f"Errors:  {len(err_arr)}")
-            af_arr = self.sp.audio_features(URIlist)
-            if hook:
-                tracks_arr = hook(tracks_arr, **hkwargs)
-            self.insert_to_mongo(tracks_arr, af_arr, err_arr)
+                print(self.limiter.report())
+            self._finish_batch(tracks_arr, err_arr, hook, hkwargs)
+        self.flush_writes(verbose)
+
+    def scrape_all_async(self, hook, hkwargs, concurrency=8, verbose=1):
+        """
+        Scrapes all tracks like scrape_all, but keeps several searches in
+        flight at once, all drawing on self.limiter. Tracks are searched
+        in waves of 50; the audio features and insert of a wave run while
+        the next wave is searched.
+
+        Args:
+            hook (function): Used to process the list of dicts before
+                inserting the documents into MongoDB.
+            hkwargs (dict): Keyword arguments for the hook.
+            concurrency (int): max searches in flight. Default 8
+            verbose (int): how much to print
+
+        Returns: None, but saves data to billboard.spotify collection.
+        """
+        asyncio.run(self._scrape_all_async(hook, hkwargs, concurrency, verbose))
+
+    async def _scrape_all_async(self, hook, hkwargs, concurrency, verbose):
+        """
+        Coroutine behind scrape_all_async. spotipy is synchronous, so its
+        calls run on a thread pool.
+        """
+        loop = asyncio.get_running_loop()
+        pool = ThreadPoolExecutor(max_workers=concurrency + 1)
+        in_flight = asyncio.Semaphore(concurrency)
+
+        async def search(row):
+            async with in_flight:
+                return await loop.run_in_executor(
+                    pool, self.get_spotify_track, row["artist"], row["title"]
+                )
+
+        finishing = None
+        try:
+            for start in range(0, len(self.to_scrape), 50):
+                wave = self.to_scrape[start : start + 50]
+                keys, found, to_search = await loop.run_in_executor(
+                    pool, self._plan_wave, wave
+                )
+                results = await asyncio.gather(*map(search, to_search.values()))
+                found.update(zip(to_search, results))
+                tracks_arr, err_arr = self._resolve_wave(wave, keys, found, to_search)
+                if verbose:
+                    print(f"__index: {start + len(wave)}")
+                    print(f"Searched: {len(to_search)}")
+                    print(f"Scraped: {len(tracks_arr)}")
+                    print(f"Errors:  {len(err_arr)}")
+                    print(self.limiter.report())
+
+                # the previous wave must be inserted before this one
+                if finishing:
+                    await finishing
+                finishing = loop.run_in_executor(
+                    pool, self._finish_batch, tracks_arr, err_arr, hook, hkwargs
+                )
+            if finishing:
+                await finishing
+
+        # the last insert and any searches still running finish before the
+        # pool goes, even if a search or insert failed
+        finally:
+            if finishing and not finishing.done():
+                await asyncio.wait([finishing])
+            pool.shutdown(wait=True)
+            self.flush_writes(verbose)
+
+    def _plan_wave(self, wave):
+        """
+        Works out which searches of a wave of tracks are needed. Tracks whose
+        normalized artist and title are in self.match_index, or repeat an
+        earlier track of the wave, are not searched again.
+
+        Args:
+            wave (list of dicts): tracks with '_id', 'artist' and 'title'
+
+        Returns: (list, dict, dict) the MatchIndex key of each track, the
+            search results already known by key, and a track to search for
+            each remaining key.
+        """
+        keys = [MatchIndex.key(row["artist"], row["title"]) for row in wave]
+        found = {}
+        if self.match_index is not None:
+            found = self.match_index.lookup(set(keys))
+        to_search = {}
+        for key, row in zip(keys, wave):
+            if key not in found:
+                to_search.setdefault(key, row)
+        return keys, found, to_search
+
+    def _resolve_wave(self, wave, keys, found, to_search):
+        """
+        Builds the track and error documents of a wave once its searches are
+        done, recording the new search results in self.match_index.
+
+        Args:
+            wave (list of dicts): tracks with '_id', 'artist' and 'title'
+            keys (list of str): MatchIndex key of each track
+            found (dict): search result, or None, by key
+            to_search (dict): track searched for each newly searched key
+
+        Returns: (list of dicts, list of dicts) tracks and errors.
+        """
+        if self.match_index is not None:
+            for key, row in to_search.items():
+                self.match_index.add(key, row["_id"], found[key])
+        tracks_arr = []
+        err_arr = []
+        for key, row in zip(keys, wave):
+            trackdata = found[key]
+            if trackdata == None:
+                err_arr.append({"_id": row["_id"], "msg": "No Spotify data"})
+            else:
+                tracks_arr.append({"_id": row["_id"], "metadata": trackdata})
+        return tracks_arr, err_arr
+
+    def _finish_batch(self, tracks_arr, err_arr, hook, hkwargs):
+        """
+        Gets the audio features of a batch of searched tracks, runs the hook
+        and inserts the batch into MongoDB.
+
+        Args:
+            tracks_arr (list of dicts): searched tracks
+            err_arr (list of dicts): error documents
+            hook (function): Used to process the list of dicts before
+                inserting the documents into MongoDB.
+            hkwargs (dict): Keyword arguments for the hook.
+
+        Returns: None
+        """
+        URIlist = list(map(lambda x: x["metadata"]["uri"], tracks_arr))
+        af_arr = self.call_api(self.sp.audio_features, URIlist) if URIlist else []
+        if hook:
+            tracks_arr = hook(tracks_arr, **hkwargs)
+        self.insert_to_mongo(tracks_arr, af_arr, err_arr)
 
     def insert_to_mongo(self, tracks_arr, af_arr, err_arr):
         """
@@ -243,25 +511,169 @@ class Spotify_Scraper:
                     {"_id": track["_id"], "msg": "No audio features returned"}
                 )
                 print(f'No audio features returned for track: {track["_id"]}')
-        try:
-            for track in tracks_arr:
-                try:
-                    self.db.spotify.insert_one(track)
-                except DuplicateKeyError:
-                    print("DuplicateKeyError: track already in audio_features")
-        except BulkWriteError as bwe:
-            print(bwe.details)
+        self.writers["spotify"].extend(tracks_arr)
+        self.writers["spotify_errlog"].extend(err_arr)
 
-        try:
-            for e in err_arr:
-                try:
-                    self.db["spotify_errlog"].insert_one(e)
-                except DuplicateKeyError:
-                    print("Duplicate Key Error adding to spotify_errlog")
-        except BulkWriteError as bwe:
-            print(bwe.details)
-        except DuplicateKeyError:
-            print("Duplicate Key Error adding to audio_errlog")
+    def flush_writes(self, verbose=1):
+        """
+        Writes out everything buffered by self.writers. Tracks and errors are
+        buffered and bulk written, so this runs at the end of each scrape.
+
+        Args:
+            verbose (int): how much to print. Default 1
+
+        Returns: None
+        """
+        writers = list(self.writers.values())
+        if self.match_index is not None:
+            writers.append(self.match_index.writer)
+        for writer in writers:
+            writer.flush()
+            if verbose and writer.flushes:
+                print(writer.report())
+        if verbose and self.match_index is not None:
+            print(self.match_index.report())
+
+
+class MatchIndex:
+    """
+    Index of Spotify search results by normalized artist and title, so a
+    track that charted again, or under a slightly different name, is not
+    searched for twice. Each key maps to the _id of the billboard.spotify
+    document the search result was saved under, or None if the search found
+    nothing. The index is kept in billboard.spotify_match_index and built
+    from billboard.spotify and billboard.spotify_errlog the first time.
+
+    Args:
+        db (pymongo Database): the billboard database
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.collection = db["spotify_match_index"]
+        self.writer = BulkWriter(self.collection)
+        self.refs = None
+        self.tracks = dict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(artist, title):
+        """
+        Normalizes an artist and title into an index key: featured artists,
+        case, punctuation and extra whitespace are dropped.
+
+        Args:
+            artist (str): artist name as charted
+            title (str): track title as charted
+
+        Returns: (str) the key.
+        """
+        strip = str.maketrans("", "", string.punctuation)
+        artist = " ".join(stripFeat(artist).casefold().translate(strip).split())
+        title = " ".join(title.casefold().translate(strip).split())
+        return f"{artist}\t{title}"
+
+    def load(self):
+        """
+        Reads the index into memory, building it first if it is empty.
+
+        Args: None
+
+        Returns: None
+        """
+        self.refs = {e["_id"]: e["ref"] for e in self.collection.find()}
+        if not self.refs:
+            self.build()
+
+    def build(self):
+        """
+        Builds the index from the billboard tracks already searched for:
+        those saved in billboard.spotify, and those logged in
+        billboard.spotify_errlog as not found.
+
+        Args: None
+
+        Returns: None
+        """
+        missed = {
+            e["_id"] for e in self.db.spotify_errlog.find({"msg": "No Spotify data"})
+        }
+        scraped = {t["_id"] for t in self.db.spotify.find({}, {"_id": 1})}
+        refs = dict()
+        for track in self.db.hot100filtered.find({}, {"artist": 1, "title": 1}):
+            if track["_id"] in scraped:
+                refs[self.key(track["artist"], track["title"])] = track["_id"]
+            elif track["_id"] in missed:
+                refs.setdefault(self.key(track["artist"], track["title"]), None)
+        self.refs = refs
+        for key, ref in refs.items():
+            self.writer.add({"_id": key, "ref": ref})
+        self.writer.flush()
+
+    def lookup(self, keys):
+        """
+        Finds the search results already known for keys.
+
+        Args:
+            keys (iterable of str): index keys
+
+        Returns: (dict) key to search result, or None if the search found
+            nothing, for the keys in the index.
+        """
+        with self._lock:
+            if self.refs is None:
+                self.load()
+            known = {k: self.refs[k] for k in keys if k in self.refs}
+
+        # results saved by earlier runs are read back from billboard.spotify
+        missing = {ref for ref in known.values() if ref is not None} - set(self.tracks)
+        if missing:
+            for track in self.db.spotify.find(
+                {"_id": {"$in": list(missing)}}, {"metadata": 1}
+            ):
+                self.tracks[track["_id"]] = track["metadata"]
+
+        found = dict()
+        for key, ref in known.items():
+            if ref is None:
+                found[key] = None
+            elif ref in self.tracks:
+                found[key] = self.tracks[ref]
+        self.hits += len(found)
+        self.misses += len(set(keys)) - len(found)
+        return found
+
+    def add(self, key, ref, trackdata):
+        """
+        Records a new search result.
+
+        Args:
+            key (str): index key
+            ref: _id the result is saved under in billboard.spotify
+            trackdata (dict): search result, or None if nothing was found
+
+        Returns: None
+        """
+        ref = ref if trackdata is not None else None
+        with self._lock:
+            if self.refs is None:
+                self.load()
+            self.refs[key] = ref
+        if ref is not None:
+            self.tracks[ref] = trackdata
+        self.writer.add({"_id": key, "ref": ref})
+
+    def report(self):
+        """
+        Describes how many searches the index saved.
+
+        Args: None
+
+        Returns: (str) one-line summary.
+        """
+        return f"match index: {self.hits} hits, {self.misses} misses"
 
 
 def insert_kv(arr, k, v):
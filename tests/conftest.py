@@ -0,0 +1,20 @@
+import pytest
+
+
+@pytest.fixture
+def mongo_db(monkeypatch):
+    """
+    An in-memory stand-in for the billboard database, from mongomock.
+    mongomock's bulk builder predates the sort argument newer pymongo passes
+    to add_update, so it is dropped.
+    """
+    mongomock = pytest.importorskip("mongomock")
+    from mongomock.collection import BulkOperationBuilder
+
+    add_update = BulkOperationBuilder.add_update
+
+    def compatible_add_update(self, *args, sort=None, **kwargs):
+        return add_update(self, *args, **kwargs)
+
+    monkeypatch.setattr(BulkOperationBuilder, "add_update", compatible_add_update)
+    return mongomock.MongoClient().billboard
@@ -0,0 +1,39 @@
+import datetime as dt
+from unittest import mock
+
+import pytest
+
+import src.billboard_scraper as billboard_scraper
+from src.billboard_scraper import chart_dates
+
+
+@pytest.mark.parametrize(
+    "today, newest",
+    [
+        ("2026-10-13", "2026-10-17"),  # Tuesday: published for the Saturday after
+        ("2026-10-14", "2026-10-17"),  # mid-week: the coming Saturday's chart
+        ("2026-10-17", "2026-10-17"),  # Saturday: that day's chart
+        ("2026-10-18", "2026-10-17"),  # Sunday: next week's is not out yet
+        ("2026-10-19", "2026-10-17"),  # Monday: next week's is not out yet
+        ("2026-10-20", "2026-10-24"),  # Tuesday: next week's is published
+    ],
+)
+def test_chart_dates_ends_at_latest_published_chart(today, newest):
+    class Today(dt.datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return dt.datetime.fromisoformat(today)
+
+    with mock.patch.object(billboard_scraper, "datetime", Today):
+        dates = chart_dates("2026-10-01")
+    assert dates[0] == newest
+    assert dates[-1] == "2026-10-03"
+
+
+def test_chart_dates_end_is_inclusive():
+    assert chart_dates("2026-10-01", "2026-10-16") == ["2026-10-10", "2026-10-03"]
+    assert chart_dates("2026-10-01", "2026-10-17") == [
+        "2026-10-17",
+        "2026-10-10",
+        "2026-10-03",
+    ]
@@ -0,0 +1,105 @@
+import pytest
+from pymongo import InsertOne
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from src import bulk_writer
+from src.bulk_writer import DUPLICATE_KEY, BulkWriter
+
+
+class FakeCollection:
+    """
+    Collection that records bulk writes and fails like MongoDB: existing
+    _ids are duplicate keys, and ids in reject fail validation.
+    """
+
+    name = "fake"
+
+    def __init__(self, reject=(), down=False):
+        self.docs = {}
+        self.writes = []
+        self.reject = set(reject)
+        self.down = down
+
+    def bulk_write(self, ops, ordered=True):
+        if self.down:
+            raise AutoReconnect("connection refused")
+        self.writes.append(ops)
+        inserted = upserted = 0
+        errors = []
+        for index, op in enumerate(ops):
+            if isinstance(op, InsertOne):
+                doc = op._doc
+                inserted += 1
+            else:
+                doc = dict(op._doc.get("$setOnInsert", {}), _id=op._filter["_id"])
+                for field in op._doc.get("$currentDate", {}):
+                    doc[field] = "now"
+                upserted += 1
+            if doc.get("_id") in self.reject:
+                errors.append({"index": index, "code": 121})
+            elif doc.get("_id") in self.docs:
+                errors.append({"index": index, "code": DUPLICATE_KEY})
+            else:
+                self.docs[doc.get("_id")] = doc
+                continue
+            inserted -= isinstance(op, InsertOne)
+            upserted -= not isinstance(op, InsertOne)
+        details = {"nInserted": inserted, "nUpserted": upserted, "nMatched": 0}
+        if errors:
+            raise BulkWriteError(dict(details, writeErrors=errors))
+        return type("Result", (), {"bulk_api_result": details})()
+
+
+def test_flushes_at_batch_size():
+    collection = FakeCollection()
+    writer = BulkWriter(collection, batch_size=3, flush_interval=3600)
+    writer.extend({"_id": i} for i in range(2))
+    assert collection.writes == []
+    writer.add({"_id": 2})
+    assert len(collection.writes) == 1 and len(collection.writes[0]) == 3
+    assert writer not in bulk_writer._unflushed
+
+
+def test_counts_duplicates_without_raising():
+    collection = FakeCollection()
+    with BulkWriter(collection) as writer:
+        writer.extend({"_id": i, "n": i} for i in range(3))
+    with BulkWriter(collection) as writer:
+        writer.extend({"_id": i, "n": -i} for i in range(2, 5))
+    assert (writer.inserted, writer.duplicates) == (2, 1)
+    assert collection.docs[2]["n"] == 2
+
+
+def test_stamped_duplicates_keep_their_stamp():
+    collection = FakeCollection()
+    writer = BulkWriter(collection, stamp="scraped")
+    writer.add({"_id": "a", "scraped": "client time"})
+    (op,) = writer._ops
+    assert op._filter == {"_id": "a", "scraped": {"$exists": False}}
+    assert op._doc == {"$currentDate": {"scraped": True}}
+    writer.flush()
+    writer.add({"_id": "a"})
+    assert writer.flush() == (0, 1)
+
+
+def test_keeps_ops_that_fail_and_raises():
+    collection = FakeCollection(reject={"bad"})
+    writer = BulkWriter(collection)
+    writer.extend([{"_id": "ok"}, {"_id": "bad"}])
+    with pytest.raises(BulkWriteError):
+        writer.flush()
+    assert writer.inserted == 1
+    assert [op._filter["_id"] for op in writer.failed] == ["bad"]
+    assert "1 failed" in writer.report()
+
+
+def test_requeues_everything_when_the_write_fails():
+    collection = FakeCollection(down=True)
+    writer = BulkWriter(collection)
+    writer.extend({"_id": i} for i in range(3))
+    with pytest.raises(AutoReconnect):
+        writer.flush()
+    assert writer in bulk_writer._unflushed
+    collection.down = False
+    assert writer.flush() == (3, 0)
+    assert writer not in bulk_writer._unflushed
@@ -0,0 +1,103 @@
+import pandas as pd
+import pytest
+import requests
+from requests.exceptions import HTTPError
+
+from src.genius_scraper import LyricsIndex, Scraper, http_error_details
+
+
+def test_http_error_details_from_lyricsgenius_error():
+    # lyricsgenius re-raises HTTPError(status_code, message) from the original
+    response = requests.Response()
+    response.status_code = 429
+    response.headers["Retry-After"] = "7"
+    try:
+        try:
+            raise HTTPError("429 Client Error", response=response)
+        except HTTPError as e:
+            raise HTTPError(response.status_code, "Too Many Requests") from e
+    except HTTPError as e:
+        assert e.response is None
+        assert http_error_details(e) == (429, "7")
+
+
+def test_http_error_details_without_response():
+    assert http_error_details(HTTPError(429, "Too Many Requests")) == (429, None)
+    assert http_error_details(HTTPError("oops")) == (None, None)
+
+
+@pytest.mark.parametrize(
+    "title",
+    [
+        "Song - 2011 Remaster",
+        "Song - Remastered",
+        "Song (Remastered 2009)",
+        "Song - 2009 Digital Remaster",
+        "Song [Clean]",
+        "Song (Explicit)",
+        "Song (feat. Someone & Someone Else)",
+        "Song [ft. Someone]",
+        "Song (Featuring Someone)",
+        "Song (Deluxe Edition)",
+        "Song - Mono",
+        "Song (Stereo Version)",
+        "Song - Mono / 2009 Remaster",
+    ],
+)
+def test_lyrics_index_key_merges_editions(title):
+    assert LyricsIndex.key("Artist", title) == LyricsIndex.key("Artist", "Song")
+
+
+@pytest.mark.parametrize(
+    "title",
+    [
+        "Song - Live",
+        "Song (Live at Wembley)",
+        "Song - Radio Edit",
+        "Song (Remix)",
+        "Song - Acoustic",
+        "Song (Spanish Version)",
+        "Song (with Someone)",
+        "Song - 2011 Remaster / Live",
+    ],
+)
+def test_lyrics_index_key_keeps_versions_apart(title):
+    assert LyricsIndex.key("Artist", title) != LyricsIndex.key("Artist", "Song")
+
+
+def test_lyrics_index_key_keeps_parenthetical_titles():
+    assert LyricsIndex.key("Artist", "Song (Dance With Me)") == (
+        "artist\tsong dance with me"
+    )
+    assert LyricsIndex.key("Artist", "Song (Dance With Me) - Remastered") == (
+        "artist\tsong dance with me"
+    )
+
+
+def test_scrape_worker_counts_failures_apart_from_songs():
+    scraper = Scraper.__new__(Scraper)
+    scraper.df = pd.DataFrame(
+        {
+            "artist_name": ["a", "b", "c", "d"],
+            "title": ["w", "x", "y", "z"],
+            "track_id": ["ok", "flaky", "broken", "timeout"],
+        }
+    )
+    attempts = []
+
+    def scrape_song(artist, title, track_id):
+        attempts.append(track_id)
+        if track_id == "flaky" and attempts.count("flaky") == 1:
+            raise ValueError("dropped connection")
+        if track_id == "broken":
+            raise KeyError("bad response")
+        return track_id == "timeout"
+
+    errors = []
+    scraper._scrape_song = scrape_song
+    scraper.record_error = lambda track_id, errtype: errors.append(track_id)
+    stats = scraper._scrape_worker(0, range(4), retries=2, backoff=0, verbose=0)
+
+    assert (stats["songs"], stats["failed"]) == (2, 2)
+    assert attempts.count("broken") == attempts.count("timeout") == 3
+    assert stats["rate"] == pytest.approx(2 / stats["seconds"])
@@ -0,0 +1,62 @@
+from unittest import mock
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+from src import http_cache
+from src.http_cache import OfflineCacheMiss, ResponseCache
+
+
+class CountingLimiter:
+    def __init__(self):
+        self.tokens = 0
+
+    def acquire(self):
+        self.tokens += 1
+
+
+def network_send(self, request, **kwargs):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = b"{}"
+    response.url = request.url
+    response.request = request
+    return response
+
+
+@pytest.fixture(autouse=True)
+def no_network():
+    with mock.patch.object(HTTPAdapter, "send", network_send):
+        yield
+
+
+def test_tokens_only_for_cache_misses(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    limiter = CountingLimiter()
+    session = http_cache.install(requests.Session(), cache, limiter)
+    session.get("https://example.com/a")
+    session.get("https://example.com/a")
+    session.get("https://example.com/b")
+    assert limiter.tokens == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_offline_replay_takes_no_tokens(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    limiter = CountingLimiter()
+    session = http_cache.install(requests.Session(), cache, limiter)
+    session.get("https://example.com/a")
+    cache.offline = True
+    session.get("https://example.com/a")
+    with pytest.raises(OfflineCacheMiss):
+        session.get("https://example.com/b")
+    assert limiter.tokens == 1
+
+
+def test_without_cache_every_request_takes_a_token():
+    limiter = CountingLimiter()
+    session = http_cache.install(requests.Session(), None, limiter)
+    session.get("https://example.com/a")
+    session.get("https://example.com/a")
+    assert limiter.tokens == 2
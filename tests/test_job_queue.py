@@ -0,0 +1,74 @@
+import time
+
+import pytest
+
+from src.job_queue import JobQueue
+
+
+def enqueue(queue, keys):
+    return queue.enqueue("test", ((key, {"key": key}) for key in keys))
+
+
+def test_enqueue_skips_jobs_already_queued(mongo_db):
+    queue = JobQueue(mongo_db)
+    assert enqueue(queue, ["a", "b"]) == 2
+    assert enqueue(queue, ["b", "c"]) == 1
+    assert queue.counts("test") == {"queued": 3}
+
+
+def test_claims_never_overlap(mongo_db):
+    first, second = JobQueue(mongo_db, worker="1"), JobQueue(mongo_db, worker="2")
+    enqueue(first, ["a", "b", "c"])
+    _, jobs1 = first.claim("test", 2)
+    _, jobs2 = second.claim("test", 2)
+    assert len(jobs1) == 2 and len(jobs2) == 1
+    assert not {job["key"] for job in jobs1} & {job["key"] for job in jobs2}
+
+
+def test_expired_lease_is_reclaimed(mongo_db):
+    crashed = JobQueue(mongo_db, lease_time=0.05, worker="crashed")
+    enqueue(crashed, ["a", "b"])
+    _, jobs = crashed.claim("test")
+    assert len(jobs) == 2
+    assert crashed.claim("test")[1] == []
+
+    time.sleep(0.1)
+    _, jobs = JobQueue(mongo_db, worker="next").claim("test")
+    assert sorted(job["key"] for job in jobs) == ["a", "b"]
+    assert {job["worker"] for job in jobs} == {"next"}
+    assert {job["attempts"] for job in jobs} == {2}
+
+
+def test_expired_lease_on_last_attempt_fails(mongo_db):
+    queue = JobQueue(mongo_db, lease_time=0.05, max_attempts=1)
+    enqueue(queue, ["a"])
+    queue.claim("test")
+    time.sleep(0.1)
+    assert queue.claim("test")[1] == []
+    job = mongo_db.scrape_jobs.find_one()
+    assert (job["state"], job["error"]) == ("failed", "lease expired")
+
+
+def test_fail_requeues_until_out_of_attempts(mongo_db):
+    queue = JobQueue(mongo_db, max_attempts=2)
+    enqueue(queue, ["a"])
+    token, _ = queue.claim("test")
+    queue.fail(token, "boom")
+    assert queue.counts("test") == {"queued": 1}
+
+    token, jobs = queue.claim("test")
+    assert [job["error"] for job in jobs] == ["boom"]
+    queue.fail(token, "boom again")
+    assert queue.counts("test") == {"failed": 1}
+    assert queue.claim("test")[1] == []
+
+
+def test_lease_completes_or_fails_the_batch(mongo_db):
+    queue = JobQueue(mongo_db)
+    enqueue(queue, ["a", "b"])
+    with queue.lease("test", 1) as jobs:
+        assert len(jobs) == 1
+    with pytest.raises(ValueError):
+        with queue.lease("test", 1):
+            raise ValueError("bad payload")
+    assert queue.counts("test") == {"done": 1, "queued": 1}
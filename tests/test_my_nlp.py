@@ -0,0 +1,45 @@
+from src import my_nlp
+from src.my_nlp import ScoreCache, lyrics_hash, score_lyrics
+
+
+def test_score_cache_hits_skip_rescoring():
+    cache = ScoreCache()
+    keys, new = cache.plan([(1, "la la"), (2, "oh no"), (3, "la la")])
+    assert new == [(lyrics_hash("la la"), "la la"), (lyrics_hash("oh no"), "oh no")]
+    results = cache.resolve(keys, [(key, len(text)) for key, text in new])
+    assert [(_id, scores) for _id, _, scores in results] == [(1, 5), (2, 5), (3, 5)]
+
+    keys, new = cache.plan([(4, "oh no")])
+    assert new == []
+    assert cache.resolve(keys, []) == [(4, lyrics_hash("oh no"), 5)]
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_score_cache_reuses_scores_in_the_collection(mongo_db):
+    mongo_db.lyrics.insert_one(
+        {"lyrics_hash": lyrics_hash("la la"), "dict_sentiment": {"pos": 1}}
+    )
+    cache = ScoreCache(mongo_db.lyrics)
+    keys, new = cache.plan([(1, "la la"), (2, "oh no")])
+    assert new == [(lyrics_hash("oh no"), "oh no")]
+    assert cache.resolve(keys, [(lyrics_hash("oh no"), {"pos": 0})])[0][2] == {"pos": 1}
+
+
+def test_score_lyrics_scores_shared_lyrics_once(mongo_db, monkeypatch):
+    scored = []
+
+    def score_chunk(chunk):
+        scored.extend(lyrics for _, lyrics in chunk)
+        return [(key, {"pos": len(lyrics)}) for key, lyrics in chunk]
+
+    monkeypatch.setattr(my_nlp, "_init_worker", lambda fast, batch: None)
+    monkeypatch.setattr(my_nlp, "_score_chunk", score_chunk)
+    mongo_db.lyrics.insert_many(
+        [{"_id": i, "lyrics": "la la" if i % 2 else "oh no"} for i in range(5)]
+    )
+
+    count, _ = score_lyrics(mongo_db.lyrics, processes=1, chunk_size=2, verbose=0)
+    assert count == 5
+    assert sorted(scored) == ["la la", "oh no"]
+    scores = {doc["_id"]: doc["dict_sentiment"] for doc in mongo_db.lyrics.find()}
+    assert scores == {i: {"pos": 5} for i in range(5)}
@@ -0,0 +1,156 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.benchmarks import (
+    TRANSFORM_DROPPED,
+    legacy_derived_columns,
+    make_transform_frame,
+)
+from src.pipe import BillboardData, LabelHitcountEncoder
+
+
+def make_frame():
+    """
+    A small frame like BillboardData.load's, with day, month and year
+    precision release dates, singles and multi-disc albums.
+    """
+    df = pd.DataFrame(
+        {
+            "release_date": ["2005-03-17", "1999-11", "2012", "2018-01-02", "2001"],
+            "release_date_precision": pd.Categorical(
+                ["day", "month", "year", "day", "year"]
+            ),
+            "total_tracks": np.array([12, 1, 10, 1, 20], dtype=np.int16),
+            "track_number": np.array([3, 1, 10, 1, 5], dtype=np.int16),
+            "disc_number": np.array([1, 1, 2, 1, 2], dtype=np.int16),
+            "obj_id": [None, "a", None, "b", None],
+            "poscount": np.array([1, 2, 3, 4, 5], dtype=np.float32),
+            "negcount": np.array([0, 1, 2, 3, 4], dtype=np.float32),
+        }
+    )
+    for column in TRANSFORM_DROPPED:
+        df[column] = None
+    return df
+
+
+@pytest.fixture
+def transformed():
+    bbd = BillboardData(db=object())
+    bbd.df = make_frame()
+    bbd.transform_for_models()
+    return bbd.df
+
+
+def test_transform_for_models_dtypes(transformed):
+    assert transformed.release_year.dtype == np.int16
+    assert transformed.release_month.dtype == np.float32
+    assert transformed.track_placement.dtype == np.float32
+
+
+def test_transform_for_models_values(transformed):
+    assert transformed.release_year.tolist() == [2005, 1999, 2012, 2018, 2001]
+    np.testing.assert_array_equal(
+        transformed.release_month, [3, np.nan, np.nan, 1, np.nan]
+    )
+    np.testing.assert_allclose(
+        transformed.track_placement,
+        [3 / 12, -1, 10 / 10 + 1 - 1 / 2, -1, 5 / 20 + 1 - 1 / 2],
+        rtol=1e-6,
+    )
+
+
+@pytest.mark.parametrize(
+    "make", [make_frame, lambda: make_transform_frame(500, np.random.default_rng(0))]
+)
+def test_transform_for_models_matches_legacy(make):
+    bbd = BillboardData(db=object())
+    bbd.df = make()
+    legacy = legacy_derived_columns(bbd.df)
+    bbd.transform_for_models()
+    transformed = bbd.df
+
+    # values equal the legacy ones once cast to the compact dtypes
+    expected = legacy.astype(
+        {
+            "release_year": np.int16,
+            "release_month": np.float32,
+            "track_placement": np.float32,
+        }
+    )
+    pd.testing.assert_frame_equal(
+        transformed[["release_year", "release_month", "track_placement"]], expected
+    )
+
+
+def test_balance_class_year_keeps_month_sentinel():
+    bbd = BillboardData(db=object())
+    bbd.df = make_frame()
+    bbd.balance_class_year(rseed=0)
+    months = dict(zip(bbd.df.release_date, bbd.df.release_month))
+    assert months == {"1999-11": -1, "2018-01-02": 1}
+    assert bbd.df.release_month.dtype == np.float32
+
+
+@pytest.mark.parametrize(
+    "ratio, expected",
+    [
+        (1.0, {(2000, True): 4, (2000, False): 4, (2001, True): 2, (2001, False): 2}),
+        (2.0, {(2000, True): 4, (2000, False): 8, (2001, True): 2, (2001, False): 3}),
+        (0.5, {(2000, True): 4, (2000, False): 2, (2001, True): 2, (2001, False): 1}),
+    ],
+)
+def test_balance_class_year_ratio_per_year(ratio, expected):
+    # 2002 has no Billboard tracks, so none of its tracks are kept
+    years = [2000] * 24 + [2001] * 5 + [2002] * 5
+    hits = [True] * 4 + [False] * 20 + [True] * 2 + [False] * 3 + [False] * 5
+    bbd = BillboardData(db=object())
+    bbd.df = pd.DataFrame(
+        {"release_year": years, "on_billboard": hits, "n": range(len(years))}
+    )
+    keep = bbd.balance_class_year(rseed=0, ratio=ratio)
+    counts = bbd.df.groupby(["release_year", "on_billboard"]).size().to_dict()
+    assert counts == expected
+    assert bbd.df.n.tolist() == keep.tolist()
+
+    # seeded samples are reproducible
+    bbd.df = pd.DataFrame({"release_year": years, "on_billboard": hits})
+    assert bbd.balance_class_year(rseed=0, ratio=ratio).tolist() == keep.tolist()
+
+
+@pytest.fixture
+def label_data():
+    labels = pd.Series(["Columbia", "Columbia / Def Jam", "COLUMBIA", "Indie"])
+    on_billboard = pd.Series([1, 1, 1, 0])
+    return labels, on_billboard
+
+
+@pytest.mark.parametrize(
+    "handle_unknown, expected", [("zero", [2, 0, 1]), ("ignore", [2, 0, 3])]
+)
+def test_label_encoder_unknown_labels(label_data, handle_unknown, expected):
+    encoder = LabelHitcountEncoder(handle_unknown).fit(*label_data)
+    assert encoder.hitcounts_.to_dict() == {"columbia": 3, "defjam": 1}
+    test = pd.Series(["Columbia/Def Jam", "Indie", "Unknown/Columbia"], index=[7, 8, 9])
+    encoded = encoder.transform(test)
+    assert encoded.tolist() == expected
+    assert encoded.index.tolist() == [7, 8, 9]
+
+
+def test_label_encoder_rejects_unknown_labels(label_data):
+    encoder = LabelHitcountEncoder("error").fit(*label_data)
+    assert encoder.transform(pd.Series(["Def Jam"])).tolist() == [1]
+    with pytest.raises(ValueError):
+        encoder.transform(pd.Series(["Unknown"]))
+    with pytest.raises(ValueError):
+        LabelHitcountEncoder("drop")
+
+
+def test_label_encoder_pickle_round_trip(label_data):
+    encoder = LabelHitcountEncoder("ignore").fit(*label_data)
+    restored = pickle.loads(pickle.dumps(encoder))
+    test = pd.Series(["Columbia", "Def Jam/Indie", None])
+    pd.testing.assert_series_equal(restored.transform(test), encoder.transform(test))
+    assert restored.handle_unknown == "ignore"
@@ -0,0 +1,50 @@
+import time
+
+import pytest
+
+from src.rate_limiter import MAX_RATE_FACTOR, RateLimiter, retry_after_seconds
+
+
+def test_rate_backs_off_on_429_and_recovers_to_ceiling():
+    limiter = RateLimiter(rate=2.0, increase=0.5)
+    assert limiter.max_rate == 2.0 * MAX_RATE_FACTOR
+
+    limiter.throttled()
+    limiter.throttled()
+    assert limiter.rate == pytest.approx(0.5)
+    assert limiter.throttles == 2
+
+    for _ in range(100):
+        limiter.success()
+    assert limiter.rate == limiter.max_rate
+
+
+def test_rate_never_drops_below_floor():
+    limiter = RateLimiter(rate=1.0, min_rate=0.2)
+    for _ in range(10):
+        limiter.throttled()
+    assert limiter.rate == 0.2
+
+
+def test_retry_after_pauses_callers():
+    limiter = RateLimiter(rate=float("inf"))
+    limiter.throttled(retry_after=0.2)
+    start = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - start >= 0.15
+
+
+def test_acquire_paces_requests():
+    limiter = RateLimiter(rate=20.0)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+    # the first token is already in the bucket
+    assert time.monotonic() - start >= 4 / 20.0 * 0.9
+
+
+def test_retry_after_seconds():
+    assert retry_after_seconds(None) == 0.0
+    assert retry_after_seconds("3") == 3.0
+    assert retry_after_seconds("soon") == 0.0
+    assert retry_after_seconds("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
@@ -0,0 +1,49 @@
+import threading
+import time
+
+import pytest
+
+from src.spotify_scraper import Spotify_Scraper
+
+
+class StubLimiter:
+    def report(self):
+        return ""
+
+
+def make_scraper(n_tracks):
+    scraper = Spotify_Scraper.__new__(Spotify_Scraper)
+    scraper.match_index = None
+    scraper.limiter = StubLimiter()
+    scraper.to_scrape = [
+        {"_id": i, "artist": f"artist {i}", "title": f"title {i}"}
+        for i in range(n_tracks)
+    ]
+    return scraper
+
+
+def test_scrape_all_async_finishes_last_wave_when_a_search_fails():
+    scraper = make_scraper(120)
+    inserted, flushed = [], []
+
+    def get_spotify_track(artist, title):
+        if title == "title 60":
+            raise RuntimeError("search failed")
+        return {"id": title}
+
+    def finish_batch(tracks_arr, err_arr, hook, hkwargs):
+        # slow enough that the failing search comes first
+        time.sleep(0.2)
+        inserted.extend(track["_id"] for track in tracks_arr)
+
+    scraper.get_spotify_track = get_spotify_track
+    scraper._finish_batch = finish_batch
+    scraper.flush_writes = lambda verbose=1: flushed.append(True)
+    threads = threading.active_count()
+
+    with pytest.raises(RuntimeError):
+        scraper.scrape_all_async(None, {}, concurrency=4, verbose=0)
+
+    assert sorted(inserted) == list(range(50))
+    assert flushed == [True]
+    assert threading.active_count() == threads